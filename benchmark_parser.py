@@ -0,0 +1,202 @@
+"""购物凭证解析的准确率与速度基准
+
+用 pdf/ 中的真实购物凭证（.csv 为表格的标准答案、.txt 为文本层）检查每条解析路径提取的
+商品货号、数量、单价、金额是否正确，并统计每个文件的耗时；再生成多页、数百行的合成凭证
+测试解析耗时随行数的增长。
+
+用法:
+    python benchmark_parser.py [--pdf-dir pdf] [--repeat 3] [--synthetic 50 200 500]
+"""
+import argparse
+import contextlib
+import csv
+import io
+import random
+import re
+import time
+from pathlib import Path
+
+import pdf_excel
+
+# 金额比较的容差（元）
+TOLERANCE = 0.01
+
+
+def parse_number(value):
+    value = str(value or '').replace('¥', '').replace(',', '').strip()
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def load_expected(csv_path):
+    """从 .csv 标准答案读取应提取的商品: [(货号, 数量, 单价, 金额), ...]
+
+    表格有两种列布局：数量和单价分两列，或者合并在一列（如 "2 149.00"）。
+    与解析器一致，跳过金额为0的行和自提/物流货号（500.005.97 除外）。
+    """
+    with open(csv_path, encoding='utf-8') as f:
+        rows = [row[1:] for row in csv.reader(f)][1:]
+
+    header = rows[0]
+    code_col = next(i for i, cell in enumerate(header) if '货号' in cell)
+    amount_col = next(i for i, cell in enumerate(header) if '金额' in cell)
+    price_col = next(i for i, cell in enumerate(header) if '单价' in cell)
+    qty_col = next((i for i, cell in enumerate(header) if cell.strip() == '数量'), None)
+
+    expected = []
+    for row in rows[1:]:
+        code = row[code_col].strip()
+        if not re.match(r'\d{3}\.\d{3}\.\d{2}', code):
+            continue
+        if code.startswith('500.') and code != "500.005.97":
+            continue
+        amount = parse_number(row[amount_col])
+        if not amount or amount <= 0:
+            continue
+        if qty_col is not None:
+            qty = int(parse_number(row[qty_col]))
+            unit_price = parse_number(row[price_col])
+        else:
+            qty_text, price_text = row[price_col].split(None, 1)
+            qty = int(qty_text)
+            unit_price = parse_number(price_text)
+        expected.append((code, qty, unit_price, amount))
+    return expected
+
+
+def compare_items(expected, items):
+    """逐行比较，返回 (正确行数, 错误说明列表)"""
+    errors = []
+    correct = 0
+    actual = [(i.product_code, i.quantity, i.unit_price, i.amount) for i in items]
+    for index in range(max(len(expected), len(actual))):
+        exp = expected[index] if index < len(expected) else None
+        act = actual[index] if index < len(actual) else None
+        if exp is None:
+            errors.append(f"多提取: {act}")
+        elif act is None:
+            errors.append(f"未提取: {exp}")
+        elif exp[0] != act[0]:
+            errors.append(f"货号不符: 应为 {exp}, 实际 {act}")
+        else:
+            wrong = [name for name, e, a in (('数量', exp[1], act[1]), ('单价', exp[2], act[2]), ('金额', exp[3], act[3]))
+                     if a is None or abs(e - a) > TOLERANCE]
+            if wrong:
+                errors.append(f"{exp[0]} {'/'.join(wrong)}不符: 应为 {exp[1:]}, 实际 {act[1:]}")
+            else:
+                correct += 1
+    return correct, errors
+
+
+def timed(fn, repeat):
+    """运行 repeat 次，返回 (最后一次结果, 最短耗时秒)；解析器的打印输出被丢弃"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def parser_paths(pdf_path):
+    """每条解析路径: 名称 -> 无参函数"""
+    txt_path = pdf_path.with_suffix('.txt')
+    paths = {
+        'table': lambda: pdf_excel.extract_order_info(str(pdf_path)),
+    }
+    if txt_path.exists():
+        text = txt_path.read_text(encoding='utf-8')
+        paths['text'] = lambda: pdf_excel.extract_order_info_from_text(text, str(pdf_path))
+    return paths
+
+
+def run_corpus(pdf_dir, repeat):
+    print(f"\n=== 真实凭证: {pdf_dir} ===")
+    print(f"{'文件':<28}{'路径':<8}{'应有':>6}{'提取':>6}{'正确':>6}{'耗时ms':>10}")
+    totals = {}
+    for pdf_path in sorted(Path(pdf_dir).glob('*.pdf')):
+        csv_path = pdf_path.with_suffix('.csv')
+        if not csv_path.exists():
+            continue
+        expected = load_expected(csv_path)
+        for name, fn in parser_paths(pdf_path).items():
+            items, elapsed = timed(fn, repeat)
+            correct, errors = compare_items(expected, items)
+            print(f"{pdf_path.name:<28}{name:<8}{len(expected):>6}{len(items):>6}{correct:>6}{elapsed * 1000:>10.1f}")
+            for error in errors:
+                print(f"    {error}")
+            total = totals.setdefault(name, {'expected': 0, 'extracted': 0, 'correct': 0, 'seconds': 0.0, 'files': 0})
+            total['expected'] += len(expected)
+            total['extracted'] += len(items)
+            total['correct'] += correct
+            total['seconds'] += elapsed
+            total['files'] += 1
+
+    print("\n汇总:")
+    for name, total in totals.items():
+        recall = total['correct'] / total['expected'] if total['expected'] else 0
+        precision = total['correct'] / total['extracted'] if total['extracted'] else 0
+        print(f"  {name:<6} 准确率 {precision:.1%}  召回率 {recall:.1%}  "
+              f"{total['files'] / total['seconds']:.1f} 文件/秒  {total['extracted'] / total['seconds']:.0f} 行/秒")
+    return totals
+
+
+def synthetic_receipt(line_count, seed=0, lines_per_page=40):
+    """生成一张多页合成凭证的文字和标准答案，格式与真实凭证的文本层一致"""
+    rng = random.Random(seed)
+    names = ['NISSAFORS 耐斯弗思 手推车 50.5x30x83 白色 AP', 'VÅGSJÖN 沃格逊 浴巾 70x140 深灰色 AP',
+             'HORNAVAN 霍纳文 推车 26x48x77 白色 AP', 'LÄMPLIG 兰普丽 砧板 45x38 AP', 'RIGGA丽加 晒衣架 白色 AP CN']
+    page_count = (line_count + lines_per_page - 1) // lines_per_page
+    lines = ["购物凭证(收据)", "订单号: 279999999", "商品货号 商品名称与描述 数量 商品单价 税率 折扣 金额"]
+    expected = []
+    used = set()
+    for index in range(line_count):
+        while True:
+            code = f"{rng.randrange(1000):03d}.{rng.randrange(1000):03d}.{rng.randrange(100):02d}"
+            if code not in used and not code.startswith('500.'):
+                used.add(code)
+                break
+        qty = rng.randint(1, 6)
+        unit_price = round(rng.uniform(5, 2000), 2)
+        amount = round(qty * unit_price, 2)
+        lines.append(f"{code} {rng.choice(names)} {qty} {unit_price:,.2f} 13 % ¥ {amount:,.2f}")
+        expected.append((code, qty, unit_price, amount))
+        if (index + 1) % lines_per_page == 0 and index + 1 < line_count:
+            page = (index + 1) // lines_per_page
+            lines.append(f"页 {page} /{page_count}")
+            lines.append("商品货号 商品名称与描述 数量 商品单价 税率 折扣 金额")
+    lines.append(f"页 {page_count} /{page_count}")
+    return '\n'.join(lines), expected
+
+
+def run_synthetic(sizes, repeat):
+    print("\n=== 合成凭证（文本路径） ===")
+    print(f"{'行数':>6}{'页数':>6}{'正确':>6}{'耗时ms':>10}{'每行us':>10}")
+    for size in sizes:
+        text, expected = synthetic_receipt(size, seed=size)
+        items, elapsed = timed(lambda: pdf_excel.extract_order_info_from_text(text, 'synthetic.pdf'), repeat)
+        correct, errors = compare_items(expected, items)
+        print(f"{size:>6}{(size + 39) // 40:>6}{correct:>6}{elapsed * 1000:>10.1f}{elapsed / size * 1e6:>10.1f}")
+        for error in errors[:5]:
+            print(f"    {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='购物凭证解析准确率与速度基准')
+    parser.add_argument('--pdf-dir', default=str(Path(__file__).parent / 'pdf'), help='真实凭证所在文件夹')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最短耗时')
+    parser.add_argument('--synthetic', type=int, nargs='*', default=[50, 200, 500], help='合成凭证的行数')
+    args = parser.parse_args(argv)
+
+    run_corpus(args.pdf_dir, args.repeat)
+    if args.synthetic:
+        run_synthetic(args.synthetic, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
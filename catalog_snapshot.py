@@ -0,0 +1,194 @@
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urljoin
+
+from markets import get_market
+from models import ProductPrice, format_product_code, product_key
+
+# 商品卡片中的商品页链接，例如 /cn/zh/p/adde-a-de-yi-zi-hei-se-10219163/（组合商品货号前带 s）
+PRODUCT_LINK_PATTERN = r'href="(?:https?://[^"/]+)?(/[a-z]{2}/[a-z]{2}/p/[^"]*?-s?(\d{8})/)"'
+# 分类页链接
+CATEGORY_LINK_PATTERN = r'href="((?:https?://[^"/]+)?/[a-z]{2}/[a-z]{2}/cat/[^"?#]+/)"'
+# 一个商品卡片最多占用的字符数，超出部分不再属于这个商品
+CARD_LENGTH = 4000
+
+
+class CatalogSnapshot:
+    """商品目录快照：以整数货号为键保存从分类列表页批量获取的价格
+
+    db_path 为 None 时只保存在内存中；指定路径时保存到SQLite，下次运行可以继续使用。
+    max_age（秒）为读取时默认允许的快照最长时间，超过的当作快照中没有。
+    """
+
+    def __init__(self, db_path=None, max_age=None):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path or ':memory:', check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog (
+                key INTEGER PRIMARY KEY,
+                product_number TEXT,
+                original_price REAL,
+                current_price REAL,
+                is_on_sale INTEGER,
+                promo_start TEXT,
+                promo_end TEXT,
+                url TEXT,
+                market TEXT,
+                fetched_at REAL
+            )
+        ''')
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def put_many(self, details_list, fetched_at=None):
+        """保存一批商品价格，返回保存的条数；没有价格的结果不保存"""
+        fetched_at = fetched_at or time.time()
+        rows = [(d.key, d.product_number, d.original_price, d.current_price, int(d.is_on_sale),
+                 d.promo_start, d.promo_end, d.url, d.market, fetched_at)
+                for d in details_list if d.key and d.current_price is not None]
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.conn.commit()
+        return len(rows)
+
+    def get_many(self, product_numbers, max_age=None):
+        """按货号批量读取快照，返回 {整数货号: ProductPrice}；快照中没有或超过 max_age 秒的不返回"""
+        keys = {product_key(number): number for number in product_numbers}
+        keys.pop(None, None)
+        max_age = max_age or self.max_age
+        oldest = time.time() - max_age if max_age else 0
+        found = {}
+        key_list = list(keys)
+        with self.lock:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                rows = self.conn.execute(
+                    f'SELECT key, original_price, current_price, is_on_sale, promo_start, promo_end, url, market '
+                    f'FROM catalog WHERE fetched_at >= ? AND key IN ({",".join("?" * len(chunk))})',
+                    [oldest, *chunk]
+                ).fetchall()
+                for key, original, current, on_sale, promo_start, promo_end, url, market in rows:
+                    found[key] = ProductPrice(keys[key], original, current, bool(on_sale), url, market,
+                                              promo_start, promo_end)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, product_number, max_age=None):
+        return self.get_many([product_number], max_age).get(product_key(product_number))
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM catalog').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def parse_listing_page(html_text, market=None):
+    """从分类列表页中提取每个商品卡片的货号、原价、现价和优惠有效期
+
+    以商品页链接划分商品卡片：从一个商品的链接到下一个不同商品的链接之间为这个商品的内容。
+    卡片中最低的价格为现价，最高的为原价。
+    """
+    market = get_market(market)
+    links = [(m.start(), m.group(1), m.group(2)) for m in re.finditer(PRODUCT_LINK_PATTERN, html_text)]
+    results = {}
+    for index, (start, path, number) in enumerate(links):
+        if number in results:
+            continue
+        # 同一卡片中图片和标题常常链接到同一个商品，跳到下一个不同商品的链接为止
+        end = next((s for s, _, n in links[index + 1:] if n != number), len(html_text))
+        card = html_text[start:min(end, start + CARD_LENGTH)]
+        prices = []
+        for match in re.findall(market.price_pattern, card):
+            try:
+                prices.append(market.parse_number(match))
+            except ValueError:
+                continue
+        prices = sorted(set(p for p in prices if p > 0))
+        if not prices:
+            continue
+        promo_start, promo_end = market.parse_promo_window(card)
+        results[number] = ProductPrice(
+            product_number=format_product_code(number),
+            original_price=prices[-1],
+            current_price=prices[0],
+            is_on_sale=prices[-1] > prices[0],
+            url=urljoin(market.base_url, path),
+            market=market.code,
+            promo_start=promo_start,
+            promo_end=promo_end,
+        )
+    return list(results.values())
+
+
+def discover_categories(html_text, market=None):
+    """从首页或任意页面中找出分类页链接（去重，保持顺序）"""
+    market = get_market(market)
+    urls = []
+    for link in re.findall(CATEGORY_LINK_PATTERN, html_text):
+        url = urljoin(market.base_url, link)
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def build_snapshot(snapshot, category_urls=None, market=None, client=None, rate=0.5, max_pages=50):
+    """按分类逐页抓取列表页，把商品价格写入快照；返回写入的商品数
+
+    category_urls 不传时从站点首页找分类链接。翻页直到某一页没有新商品或达到 max_pages。
+    所有请求通过同一个限速的 FetchClient 发出。
+    """
+    from fetch_client import FetchClient
+    from update_ikea_prices import USER_AGENTS
+
+    market = get_market(market)
+    owns_client = client is None
+    client = client or FetchClient(rate=rate)
+    headers = {
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept': 'text/html,application/xhtml+xml,application/xml',
+        'Accept-Language': market.accept_language
+    }
+
+    seen = set()
+    pages = 0
+    try:
+        if not category_urls:
+            response = client.get(market.base_url, headers=headers, timeout=10)
+            category_urls = discover_categories(response.text, market) if response.status_code == 200 else []
+            logging.info(f"从首页找到 {len(category_urls)} 个分类")
+
+        for category_url in category_urls:
+            for page in range(1, max_pages + 1):
+                url = f"{category_url}{'&' if '?' in category_url else '?'}page={page}"
+                try:
+                    response = client.get(url, headers=headers, timeout=10)
+                except Exception as e:
+                    logging.warning("列表页 %s 访问失败: %s", url, e)
+                    break
+                pages += 1
+                if response.status_code != 200:
+                    logging.warning("列表页 %s 返回 %s", url, response.status_code)
+                    break
+                details = [d for d in parse_listing_page(response.text, market) if d.key not in seen]
+                if not details:
+                    break
+                seen.update(d.key for d in details)
+                snapshot.put_many(details)
+            logging.info(f"分类 {category_url} 完成，快照中共 {len(seen)} 个商品")
+    finally:
+        if owns_client:
+            client.close()
+
+    logging.info(f"目录快照完成: 抓取 {pages} 个列表页，{len(seen)} 个商品")
+    return len(seen)
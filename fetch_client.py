@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+
+# 使用代理池时，一个请求最多经由几个代理尝试（代理掉线或被拦截时换下一个）
+PROXY_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒 rate 个请求，最多允许 capacity 个突发请求"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """有令牌时取走一个并返回 True，否则立即返回 False"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """取走一个令牌，没有令牌时等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchClient:
+    """复用连接的HTTP客户端，可选限速
+
+    多个线程可以共用同一个客户端；连接池大小 pool_size 决定同时保持的连接数。
+    validators 为 validator_store.ValidatorStore 时，对查询过的页面发送条件请求。
+    proxy_pool 为 proxy_pool.ProxyPool 时，请求经由代理池中的代理发出，每个代理单独限速；
+    代理连接失败或返回拦截页面时换一个代理重试，最多尝试 PROXY_ATTEMPTS 个代理。
+    """
+
+    def __init__(self, rate=None, burst=1, pool_size=10, validators=None, proxy_pool=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.validators = validators
+        self.proxy_pool = proxy_pool
+        self.request_count = 0
+        # 多个线程共用同一个客户端，计数需要加锁
+        self.count_lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=10, key=None, conditional=True):
+        """发送GET请求；key 为使用代理池时固定分配代理的依据（例如商品货号），默认为URL
+
+        conditional=False 时不附加条件请求头，总是取得完整页面
+        """
+        if self.validators and conditional:
+            conditional = self.validators.conditional_headers(url)
+            if conditional:
+                headers = {**(headers or {}), **conditional}
+        if self.bucket:
+            self.bucket.acquire()
+        with self.count_lock:
+            self.request_count += 1
+        if not self.proxy_pool:
+            return self.session.get(url, headers=headers, timeout=timeout)
+
+        # 代理连接失败或被拦截时该代理已被记录（可能被隔离），换下一个代理重试
+        tried = []
+        for attempt in range(PROXY_ATTEMPTS):
+            last = attempt == PROXY_ATTEMPTS - 1
+            proxy = self.proxy_pool.acquire(key or url, exclude=tried)
+            tried.append(proxy)
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, headers=headers, timeout=timeout,
+                                            proxies={'http': proxy.url, 'https': proxy.url})
+            except Exception as e:
+                self.proxy_pool.report(proxy, time.monotonic() - started, ok=False)
+                if last:
+                    raise
+                logging.debug("代理 %s 访问 %s 失败，换代理重试: %s", proxy.url, url, e)
+                continue
+            if not self.proxy_pool.report_response(proxy, response, time.monotonic() - started):
+                return response
+            logging.warning("代理 %s 访问 %s 时被拦截", proxy.url, url)
+            if last:
+                return response
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def configure_default_client(**kwargs):
+    """用指定参数（同 FetchClient）替换进程内共用的客户端"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is not None:
+            _default_client.close()
+        _default_client = FetchClient(**kwargs)
+        return _default_client
+
+
+def default_client():
+    """进程内共用的客户端（默认不限速，调用方自己控制访问间隔）"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = FetchClient()
+            logging.debug("创建默认HTTP客户端")
+        return _default_client
@@ -0,0 +1,361 @@
+"""宜家价格工具命令行入口
+
+用法:
+    python ikea_prices.py check 705.316.56 [102.635.24 ...] [--unit-price 2499]
+    python ikea_prices.py markets 705.316.56 [...] [--markets cn de us] [--rates CNY=1 EUR=7.8 USD=7.2]
+    python ikea_prices.py update [订单汇总.xlsx] [--queue sqlite:///price_queue.db]
+    python ikea_prices.py update [订单汇总.xlsx] --only 705.316.56 [102.635.24 ...]
+    python ikea_prices.py update [订单汇总.xlsx] --delta
+    python ikea_prices.py update [订单汇总.xlsx] --promo-db promo.db
+    python ikea_prices.py snapshot --db catalog.db [--category 分类页网址 ...]
+    python ikea_prices.py update [订单汇总.xlsx] --snapshot catalog.db
+    python ikea_prices.py schedule [订单汇总.xlsx] --promo-db promo.db [--interval 3600]
+    python ikea_prices.py compact [订单汇总.xlsx]
+    python ikea_prices.py worker --queue sqlite:///price_queue.db
+    python ikea_prices.py ingest [pdf文件夹] [订单汇总.xlsx]
+    python ikea_prices.py pipeline [pdf文件夹] [订单汇总.xlsx] [--refresh-ledger]
+    python ikea_prices.py pipeline [pdf文件夹] [订单汇总.xlsx] --proxies proxies.txt --fetchers 8
+    python ikea_prices.py update [订单汇总.xlsx] --archive page_archive
+    python ikea_prices.py update [订单汇总.xlsx] --render-fallback [--render-workers 2]
+    python ikea_prices.py archive 705.316.56 [--dir page_archive] [--reparse] [--output page.html]
+    python ikea_prices.py --log-level DEBUG --log-json --log-file run.log update [订单汇总.xlsx]
+    python ikea_prices.py daemon [订单汇总.xlsx] [--port 8765]
+
+各子命令只在执行时才导入自己需要的模块，查询单个商品时不会加载 pandas/openpyxl/pdfplumber。
+"""
+import argparse
+import sys
+import time
+
+DEFAULT_EXCEL = "F:\\宜家自动查询\\订单汇总.xlsx"
+DEFAULT_PDF_FOLDER = "F:\\宜家自动查询\\pdf"
+DELTA_HELP = '只把改动追加到 <Excel>.delta.jsonl，不改写整个Excel；之后用 compact 合并'
+
+
+def configure_client(args):
+    """按命令行参数配置进程内共用的HTTP客户端（条件请求、代理池）、页面存档和渲染池；没有客户端参数时返回 None"""
+    from fetch_client import configure_default_client
+
+    if getattr(args, 'archive', None):
+        from page_archive import configure_archive
+
+        configure_archive(args.archive, codec=args.archive_codec)
+    if getattr(args, 'render_fallback', False):
+        from render_fallback import configure_renderer
+
+        configure_renderer(size=args.render_workers, executable_path=args.browser_path)
+    kwargs = {}
+    if getattr(args, 'validator_db', None):
+        from validator_store import ValidatorStore
+
+        kwargs['validators'] = ValidatorStore(args.validator_db)
+    if getattr(args, 'proxies', None):
+        from proxy_pool import ProxyPool, load_proxies
+
+        proxy_pool = ProxyPool(load_proxies(args.proxies, rate=args.proxy_rate))
+        kwargs['proxy_pool'] = proxy_pool
+        kwargs['pool_size'] = max(10, len(proxy_pool.proxies))
+        print(f"使用 {len(proxy_pool.proxies)} 个代理，每个代理每秒最多 {args.proxy_rate} 次")
+    return configure_default_client(**kwargs) if kwargs else None
+
+
+def add_proxy_arguments(parser):
+    parser.add_argument('--proxies', help='代理列表文件，每行一个代理地址（可在后面写该代理每秒最多访问的次数和分配权重）；'
+                                          'update 按代理数并发查询，pipeline 用 --fetchers 设置线程数，worker 仍逐个查询')
+    parser.add_argument('--proxy-rate', type=float, default=0.5, help='每个代理默认每秒最多访问的次数')
+
+
+def add_archive_arguments(parser):
+    parser.add_argument('--archive', help='页面存档目录，抓取到的商品页面压缩后保存在这里（见 archive 子命令）')
+    parser.add_argument('--archive-codec', choices=('gzip', 'zstd'), default='gzip', help='页面存档的压缩方式')
+
+
+def add_render_arguments(parser):
+    parser.add_argument('--render-fallback', action='store_true',
+                        help='页面中找不到价格时用无头浏览器渲染后再解析（需要安装 playwright）')
+    parser.add_argument('--render-workers', type=int, default=2, help='同时渲染的页面数')
+    parser.add_argument('--browser-path', help='使用已安装的 Chrome/Chromium 渲染，可执行文件的路径')
+
+
+def cmd_check(args):
+    configure_client(args)
+    from update_ikea_prices import test_single_product, test_with_unit_price
+
+    ok = True
+    for product_number in args.product_numbers:
+        if args.unit_price is not None:
+            details = test_with_unit_price(product_number, args.unit_price)
+        else:
+            details = test_single_product(product_number)
+        ok = ok and details.current_price is not None
+    return 0 if ok else 1
+
+
+def cmd_markets(args):
+    from markets import compare_markets
+
+    rates = {}
+    for item in args.rates or []:
+        currency, _, value = item.partition('=')
+        rates[currency.upper()] = float(value)
+    matrix = compare_markets(args.product_numbers, args.markets, rates=rates or None, rate=args.rate)
+    print(matrix.to_string())
+    return 0
+
+
+def cmd_update(args):
+    configure_client(args)
+
+    if args.only:
+        from update_ikea_prices import update_products
+
+        print(f"开始更新Excel文件中的 {len(args.only)} 个商品: {args.excel}")
+        # 只涉及少数几行，总是写入增量文件，不改写整个Excel
+        result = update_products(args.excel, args.only)
+    elif args.queue:
+        from work_queue import open_queue, run_coordinator
+
+        print(f"协调者模式，开始更新Excel文件: {args.excel}")
+        result = run_coordinator(args.excel, open_queue(args.queue), delta=args.delta)
+    else:
+        from update_ikea_prices import update_excel_prices
+
+        calendar = None
+        if args.promo_db:
+            from promo_calendar import PromoCalendar
+
+            calendar = PromoCalendar(args.promo_db)
+        snapshot = None
+        if args.snapshot:
+            from catalog_snapshot import CatalogSnapshot
+
+            snapshot = CatalogSnapshot(args.snapshot, max_age=args.snapshot_max_age * 3600)
+        print(f"开始更新Excel文件: {args.excel}")
+        result = update_excel_prices(args.excel, delta=args.delta, calendar=calendar, snapshot=snapshot)
+
+    if result:
+        print("Excel更新成功！")
+        return 0
+    print("Excel更新失败，请检查日志")
+    return 1
+
+
+def cmd_snapshot(args):
+    from catalog_snapshot import CatalogSnapshot, build_snapshot
+
+    snapshot = CatalogSnapshot(args.db)
+    try:
+        count = build_snapshot(snapshot, args.category, market=args.market, rate=args.rate, max_pages=args.max_pages)
+        print(f"已写入 {count} 个商品，快照中共 {snapshot.count()} 个商品: {args.db}")
+    finally:
+        snapshot.close()
+    return 0
+
+
+def cmd_schedule(args):
+    from promo_calendar import PromoCalendar, run_scheduler
+
+    calendar = PromoCalendar(args.promo_db, recheck_hours=args.recheck_hours)
+    for product_number, promo_end in calendar.upcoming():
+        print(f"{product_number} 的优惠将于 {promo_end} 结束")
+    try:
+        run_scheduler(args.excel, calendar, poll_interval=args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        calendar.close()
+    return 0
+
+
+def cmd_worker(args):
+    from work_queue import open_queue, run_worker
+
+    print(f"工作节点模式，队列: {args.queue}")
+    configure_client(args)
+
+    run_worker(open_queue(args.queue), exit_when_empty=args.exit_when_empty)
+    return 0
+
+
+def cmd_ingest(args):
+    from pdf_excel import process_pdf_folder
+
+    process_pdf_folder(args.pdf_folder, args.excel, delta=args.delta)
+    return 0
+
+
+def cmd_pipeline(args):
+    from pipeline import run_pipeline
+
+    calendar = None
+    if args.promo_db:
+        from promo_calendar import PromoCalendar
+
+        calendar = PromoCalendar(args.promo_db)
+    stats = run_pipeline(args.pdf_folder, args.excel, rate=args.rate, fetchers=args.fetchers,
+                         batch_size=args.batch_size, refresh_ledger=args.refresh_ledger, calendar=calendar,
+                         client=configure_client(args))
+    return 0 if stats else 1
+
+
+def cmd_compact(args):
+    from ledger_delta import compact
+
+    count = compact(args.excel)
+    print(f"已合并 {count} 条改动到: {args.excel}")
+    return 0
+
+
+def cmd_archive(args):
+    from page_archive import PageArchive
+
+    archive = PageArchive(args.dir)
+    try:
+        if args.reparse:
+            from update_ikea_prices import parse_product_page
+
+        for capture, html_text in archive.pages(args.product_number, limit=args.limit):
+            fetched_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(capture['fetched_at']))
+            line = f"{fetched_at}  {capture['hash'][:12]}  {len(html_text):>8} 字符  {capture['url']}"
+            if args.reparse:
+                details = parse_product_page(html_text, args.product_number, capture['url'])
+                line += f"  原价 {details.original_price}，现价 {details.current_price}，促销 {details.is_on_sale}"
+            print(line)
+        if args.output:
+            html_text = archive.latest(args.product_number)
+            if html_text is None:
+                print(f"存档中没有商品 {args.product_number} 的页面")
+                return 1
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(html_text)
+            print(f"已导出最近一次抓取的页面到: {args.output}")
+    finally:
+        archive.close()
+    return 0
+
+
+def cmd_daemon(args):
+    from price_daemon import serve
+
+    serve(args.excel, host=args.host, port=args.port, rate=args.rate, delta=args.delta)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ikea-prices', description='宜家订单价格比对工具')
+    parser.add_argument('--log-level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help='日志级别；DEBUG 时显示每个商品尝试的网址、找到的价格等详细信息')
+    parser.add_argument('--log-json', action='store_true', help='每条日志输出为一行JSON')
+    parser.add_argument('--log-file', help='同时把日志写入该文件')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    check = subparsers.add_parser('check', help='查询单个或多个商品的当前价格')
+    check.add_argument('product_numbers', nargs='+', help='商品货号，例如 705.316.56')
+    check.add_argument('--unit-price', type=float, help='购买时的单价，用于判断是否降价')
+    add_proxy_arguments(check)
+    add_archive_arguments(check)
+    add_render_arguments(check)
+    check.set_defaults(func=cmd_check)
+
+    markets = subparsers.add_parser('markets', help='在多个国家/地区站点同时查询商品，比较价格')
+    markets.add_argument('product_numbers', nargs='+', help='商品货号，例如 705.316.56')
+    markets.add_argument('--markets', nargs='+', help='站点代码（cn us gb de se jp），默认全部')
+    markets.add_argument('--rates', nargs='+', metavar='货币=汇率', help='折算汇率，例如 CNY=1 EUR=7.8 USD=7.2')
+    markets.add_argument('--rate', type=float, default=0.5, help='每个站点每秒最多访问的次数')
+    markets.set_defaults(func=cmd_markets)
+
+    update = subparsers.add_parser('update', help='查询订单汇总表中所有商品的现价并标记降价')
+    update.add_argument('excel', nargs='?', default=DEFAULT_EXCEL, help='订单汇总Excel文件')
+    update.add_argument('--queue', help='以协调者身份运行，把货号分发到该队列（sqlite:///路径 或 redis://地址）')
+    update.add_argument('--validator-db', help='保存页面校验信息的SQLite文件，再次运行时跳过未变化的页面')
+    update.add_argument('--only', nargs='+', metavar='货号',
+                        help='只查询并更新这些商品货号所在的行（改动总是写入增量文件，之后用 compact 合并）')
+    update.add_argument('--delta', action='store_true', help=DELTA_HELP)
+    update.add_argument('--promo-db', help='促销日历SQLite文件，跳过价格锁定在优惠期内的商品')
+    update.add_argument('--snapshot', help='目录快照SQLite文件（见 snapshot 子命令），快照中没有的商品才在线查询')
+    update.add_argument('--snapshot-max-age', type=float, default=24, help='快照超过多少小时视为过期')
+    add_proxy_arguments(update)
+    add_archive_arguments(update)
+    add_render_arguments(update)
+    update.set_defaults(func=cmd_update)
+
+    snapshot = subparsers.add_parser('snapshot', help='按分类批量抓取列表页，建立本地商品目录快照')
+    snapshot.add_argument('--db', required=True, help='目录快照SQLite文件')
+    snapshot.add_argument('--category', nargs='+', help='分类页网址，默认从站点首页查找')
+    snapshot.add_argument('--market', default='cn', help='站点代码（cn us gb de se jp）')
+    snapshot.add_argument('--rate', type=float, default=0.5, help='每秒最多访问的次数')
+    snapshot.add_argument('--max-pages', type=int, default=50, help='每个分类最多翻多少页')
+    snapshot.set_defaults(func=cmd_snapshot)
+
+    schedule = subparsers.add_parser('schedule', help='按促销日历定期复查到期的商品（促销结束后立即复查，改动写入增量文件）')
+    schedule.add_argument('excel', nargs='?', default=DEFAULT_EXCEL, help='订单汇总Excel文件')
+    schedule.add_argument('--promo-db', required=True, help='促销日历SQLite文件')
+    schedule.add_argument('--interval', type=float, default=3600, help='每隔多少秒检查一次到期的商品')
+    schedule.add_argument('--recheck-hours', type=float, default=24, help='没有优惠有效期的商品多少小时后复查')
+    schedule.set_defaults(func=cmd_schedule)
+
+    worker = subparsers.add_parser('worker', help='作为工作节点从队列领取货号查询价格')
+    worker.add_argument('--queue', required=True, help='队列地址（sqlite:///路径 或 redis://地址）')
+    worker.add_argument('--exit-when-empty', action='store_true', help='队列为空时退出，而不是继续等待')
+    worker.add_argument('--validator-db', help='保存页面校验信息的SQLite文件，再次运行时跳过未变化的页面')
+    add_proxy_arguments(worker)
+    add_archive_arguments(worker)
+    add_render_arguments(worker)
+    worker.set_defaults(func=cmd_worker)
+
+    ingest = subparsers.add_parser('ingest', help='从PDF购物凭证中提取订单并追加到订单汇总表')
+    ingest.add_argument('pdf_folder', nargs='?', default=DEFAULT_PDF_FOLDER, help='PDF文件夹')
+    ingest.add_argument('excel', nargs='?', default=DEFAULT_EXCEL, help='订单汇总Excel文件')
+    ingest.add_argument('--delta', action='store_true', help=DELTA_HELP)
+    ingest.set_defaults(func=cmd_ingest)
+
+    pipeline = subparsers.add_parser('pipeline', help='提取PDF购物凭证并同时查询价格，结果分批写入订单汇总表')
+    pipeline.add_argument('pdf_folder', nargs='?', default=DEFAULT_PDF_FOLDER, help='PDF文件夹')
+    pipeline.add_argument('excel', nargs='?', default=DEFAULT_EXCEL, help='订单汇总Excel文件')
+    pipeline.add_argument('--refresh-ledger', action='store_true', help='同时查询订单汇总表中已有的商品')
+    pipeline.add_argument('--rate', type=float, default=0.5, help='每秒最多访问宜家网站的次数')
+    pipeline.add_argument('--fetchers', type=int, default=4, help='查询线程数')
+    pipeline.add_argument('--batch-size', type=int, default=50, help='攒够多少条改动写入一次')
+    pipeline.add_argument('--promo-db', help='促销日历SQLite文件，跳过价格锁定在优惠期内的商品')
+    add_proxy_arguments(pipeline)
+    add_archive_arguments(pipeline)
+    add_render_arguments(pipeline)
+    pipeline.set_defaults(func=cmd_pipeline)
+
+    compact = subparsers.add_parser('compact', help='把增量文件中的改动合并进订单汇总表')
+    compact.add_argument('excel', nargs='?', default=DEFAULT_EXCEL, help='订单汇总Excel文件')
+    compact.set_defaults(func=cmd_compact)
+
+    archive = subparsers.add_parser('archive', help='查看页面存档中某个商品历次抓取的页面，可重新解析价格')
+    archive.add_argument('product_number', help='商品货号，例如 705.316.56')
+    archive.add_argument('--dir', default='page_archive', help='页面存档目录')
+    archive.add_argument('--limit', type=int, help='最多列出最近多少次抓取')
+    archive.add_argument('--reparse', action='store_true', help='用当前的解析代码重新提取每个历史页面的价格')
+    archive.add_argument('--output', help='把最近一次抓取的页面导出为HTML文件')
+    archive.set_defaults(func=cmd_archive)
+
+    daemon = subparsers.add_parser('daemon', help='启动常驻价格服务，提供本地HTTP/JSON查询接口')
+    daemon.add_argument('excel', nargs='?', default=DEFAULT_EXCEL, help='订单汇总Excel文件')
+    daemon.add_argument('--host', default='127.0.0.1', help='监听地址')
+    daemon.add_argument('--port', type=int, default=8765, help='监听端口')
+    daemon.add_argument('--rate', type=float, default=0.5, help='每秒最多访问宜家网站的次数')
+    daemon.add_argument('--delta', action='store_true', help=DELTA_HELP)
+    daemon.set_defaults(func=cmd_daemon)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    from structured_log import counters, setup_logging
+
+    # 日志由后台线程格式化和输出，查询和解析线程只把记录放入队列
+    setup_logging(args.log_level, json_format=args.log_json, log_file=args.log_file)
+    try:
+        return args.func(args)
+    finally:
+        counters.log_summary()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+# 标记价格变化/降价行使用的填充色
+MARK_COLOR = 'FFFF00'
+
+
+def delta_path(excel_file):
+    """待合并的改动保存在订单汇总表旁边，例如 订单汇总.xlsx.delta.jsonl"""
+    return Path(f"{excel_file}.delta.jsonl")
+
+
+def _json_default(value):
+    # numpy/pandas 的数值类型
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def record_changes(excel_file, cells=(), marks=()):
+    """把改动追加到增量文件，不改写订单汇总表
+
+    cells 为 [(行号, 列名, 值), ...]，行号超出表格末尾时表示追加的新行；
+    marks 为需要标记填充色的行号。每次追加后立即落盘，耗时只与改动数量有关。
+    返回写入的改动条数。
+    """
+    lines = [json.dumps({'row': int(row), 'column': column, 'value': value},
+                        ensure_ascii=False, default=_json_default)
+             for row, column, value in cells]
+    lines += [json.dumps({'row': int(row), 'mark': True}) for row in marks]
+    if not lines:
+        return 0
+    path = delta_path(excel_file)
+    # 上次写入中途中断时最后一行可能没有换行符，先补上，新的改动不会和不完整的行连在一起
+    if path.exists() and path.stat().st_size:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                lines[0] = '\n' + lines[0]
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    return len(lines)
+
+
+def pending_changes(excel_file):
+    """读取尚未合并的改动，返回 (cells, marks)
+
+    cells 为 {(行号, 列名): 值}，同一单元格后写的覆盖先写的；marks 为行号集合。
+    写入中途中断留下的不完整行会被跳过。
+    """
+    cells = {}
+    marks = set()
+    path = delta_path(excel_file)
+    if not path.exists():
+        return cells, marks
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            try:
+                change = json.loads(line)
+            except ValueError:
+                logging.warning("跳过增量文件中不完整的第 %d 行", line_number)
+                continue
+            if change.get('mark'):
+                marks.add(change['row'])
+            else:
+                cells[(change['row'], change['column'])] = change['value']
+    return cells, marks
+
+
+def overlay_frame(df, excel_file):
+    """把尚未合并的改动叠加到DataFrame上（索引为Excel中的行号），追加的新行按行号排在末尾"""
+    import pandas as pd
+
+    cells, _ = pending_changes(excel_file)
+    if not cells:
+        return df
+    new_rows = sorted({row for row, _ in cells} - set(df.index))
+    df = df.reindex(df.index.append(pd.Index(new_rows)))
+    # 改动的值类型不一定与原列一致，先转为object逐个写入，最后再推断类型
+    for column in {column for _, column in cells}:
+        df[column] = df[column].astype(object) if column in df.columns else None
+    for (row, column), value in cells.items():
+        df.at[row, column] = value
+    return df.sort_index().infer_objects()
+
+
+def read_ledger(excel_file):
+    """用pandas读取订单汇总表并叠加尚未合并的改动，索引为Excel中的行号（表头为第1行）"""
+    import pandas as pd
+
+    df = pd.read_excel(excel_file)
+    df.index = range(2, len(df) + 2)
+    return overlay_frame(df, excel_file)
+
+
+def mark_row(ws, row):
+    """给一整行设置标记填充色"""
+    from openpyxl.styles import PatternFill
+
+    fill = PatternFill(start_color=MARK_COLOR, end_color=MARK_COLOR, fill_type='solid')
+    for col in range(1, ws.max_column + 1):
+        ws.cell(row=row, column=col).fill = fill
+
+
+def load_ledger_workbook(excel_file):
+    """打开订单汇总表，并把尚未合并的改动写入工作表（只在内存中，保存时才写回文件）"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(excel_file)
+    cells, marks = pending_changes(excel_file)
+    if cells or marks:
+        ws = wb.active
+        columns = {cell.value: cell.column for cell in ws[1] if cell.value}
+        for (row, column), value in cells.items():
+            if column not in columns:
+                columns[column] = ws.max_column + 1
+                ws.cell(row=1, column=columns[column]).value = column
+            ws.cell(row=row, column=columns[column]).value = value
+        for row in marks:
+            mark_row(ws, row)
+    return wb
+
+
+def _fsync_directory(directory):
+    """让目录中的文件替换落盘（Windows 不支持打开目录，跳过）"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_save(save, excel_file):
+    """先写到同一文件夹下的临时文件再替换原文件，保存中途出错不会损坏原来的表格
+
+    save 为接收文件路径的保存函数，例如 wb.save 或 lambda path: df.to_excel(path, index=False)。
+    """
+    excel_file = Path(excel_file)
+    tmp_file = excel_file.with_name(f"{excel_file.stem}.tmp-{os.getpid()}{excel_file.suffix}")
+    try:
+        save(str(tmp_file))
+        # save 已写完并关闭临时文件；先让内容落盘再替换，否则断电后可能留下替换过但内容不完整的文件
+        with open(tmp_file, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_file, excel_file)
+        _fsync_directory(excel_file.parent)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+
+def clear_changes(excel_file):
+    """订单汇总表已包含全部改动后删除增量文件"""
+    path = delta_path(excel_file)
+    if path.exists():
+        path.unlink()
+
+
+def save_ledger_workbook(wb, excel_file, index=None):
+    """完整保存订单汇总表（包含已合并的改动），并删除增量文件
+
+    传入 index（ledger_index.LedgerIndex）时让索引记录保存后的文件状态。
+    """
+    atomic_save(wb.save, excel_file)
+    clear_changes(excel_file)
+    if index is not None:
+        index.save(refresh_signature=True)
+
+
+def compact(excel_file):
+    """把增量文件中的改动合并进订单汇总表，完整改写一次；返回合并的改动条数"""
+    from ledger_index import LedgerIndex, index_path
+
+    cells, marks = pending_changes(excel_file)
+    count = len(cells) + len(marks)
+    if not count:
+        logging.info("没有需要合并的改动")
+        return 0
+    index = LedgerIndex.load(excel_file) if index_path(excel_file).exists() else None
+    save_ledger_workbook(load_ledger_workbook(excel_file), excel_file, index)
+    logging.info(f"已把 {count} 条改动合并进订单汇总表")
+    return count
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+from ledger_delta import delta_path, pending_changes
+from models import product_key
+
+
+def index_path(excel_file):
+    """索引文件保存在订单汇总表旁边，例如 订单汇总.xlsx.index.json"""
+    return Path(f"{excel_file}.index.json")
+
+
+def file_signature(excel_file):
+    """用修改时间和大小（以及增量文件的大小）判断订单汇总表是否在索引之外被改动过"""
+    stat = os.stat(excel_file)
+    delta = delta_path(excel_file)
+    return [stat.st_mtime_ns, stat.st_size, delta.stat().st_size if delta.exists() else 0]
+
+
+class LedgerIndex:
+    """订单汇总表的货号索引: 整数货号 -> 所在的行号列表，以及表头各列的列号
+
+    查询或更新少数几个商品时，不需要扫描表头和所有行就能直接定位到对应的单元格。
+    """
+
+    def __init__(self, excel_file, columns=None, rows=None, signature=None, max_row=1):
+        self.excel_file = str(excel_file)
+        self.columns = columns or {}
+        self.rows = rows or {}
+        self.signature = signature
+        self.max_row = max_row
+
+    @property
+    def next_row(self):
+        """下一行追加数据所在的行号"""
+        return self.max_row + 1
+
+    def rows_for(self, product_number):
+        return self.rows.get(product_key(product_number), [])
+
+    def add_row(self, row, product_number):
+        key = product_key(product_number)
+        if key is not None:
+            self.rows.setdefault(key, []).append(row)
+        self.max_row = max(self.max_row, row)
+
+    def read_rows(self, rows):
+        """只读取指定的行并叠加尚未合并的改动，得到以行号为索引、列为表头各列的DataFrame
+
+        以只读方式从第一个需要的行读到最后一个需要的行为止，之后的行不再解析，
+        也不把整张表读进内存；只存在于增量文件中的追加行直接从增量文件取值。
+        """
+        import pandas as pd
+        from openpyxl import load_workbook
+
+        rows = sorted(set(rows))
+        columns = list(self.columns)
+        data = {}
+        if rows:
+            wanted = set(rows)
+            wb = load_workbook(self.excel_file, read_only=True)
+            try:
+                values_by_row = wb.active.iter_rows(min_row=rows[0], max_row=rows[-1], values_only=True)
+                for row_number, values in enumerate(values_by_row, start=rows[0]):
+                    if row_number in wanted:
+                        data[row_number] = {name: values[col - 1] if col <= len(values) else None
+                                            for name, col in self.columns.items()}
+            finally:
+                wb.close()
+
+        cells, _ = pending_changes(self.excel_file)
+        for (row, column), value in cells.items():
+            if row in data or row in rows:
+                if column not in columns:
+                    columns.append(column)
+                data.setdefault(row, {})[column] = value
+        df = pd.DataFrame([data.get(row, {}) for row in rows], columns=columns, index=rows)
+        return df.infer_objects()
+
+    @classmethod
+    def build(cls, excel_file):
+        """扫描一遍订单汇总表建立索引"""
+        from openpyxl import load_workbook
+
+        wb = load_workbook(excel_file, read_only=True)
+        try:
+            ws = wb.active
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            index = cls(excel_file, {name: col for col, name in enumerate(header, start=1) if name})
+            code_col = index.columns.get('商品货号')
+            for row_number, values in enumerate(rows, start=2):
+                index.max_row = row_number
+                if code_col and code_col <= len(values) and values[code_col - 1]:
+                    index.add_row(row_number, values[code_col - 1])
+        finally:
+            wb.close()
+        
+        # 以增量方式追加、尚未合并进表格的行（见 ledger_delta）
+        cells, _ = pending_changes(excel_file)
+        scanned_rows = index.max_row
+        for (row, column), value in sorted(cells.items()):
+            if row > scanned_rows:
+                index.max_row = max(index.max_row, row)
+                if column == '商品货号' and value:
+                    index.add_row(row, value)
+        index.signature = file_signature(excel_file)
+        logging.info(f"已建立订单汇总表索引: {len(index.rows)} 个货号，{index.max_row - 1} 行")
+        return index
+
+    @classmethod
+    def from_frame(cls, df, excel_file):
+        """由刚写入Excel的DataFrame建立索引（表头在第1行，数据从第2行开始，索引为0开始的连续整数）"""
+        index = cls(excel_file, {name: col for col, name in enumerate(df.columns, start=1)}, max_row=len(df) + 1)
+        if '商品货号' in df.columns:
+            for offset, code in enumerate(df['商品货号'].tolist()):
+                if code is not None and code == code:
+                    index.add_row(offset + 2, code)
+        return index
+
+    @classmethod
+    def load(cls, excel_file):
+        """读取索引；索引不存在或订单汇总表已在别处被修改时重新建立"""
+        path = index_path(excel_file)
+        if path.exists():
+            try:
+                data = json.loads(path.read_text(encoding='utf-8'))
+                if data.get('signature') == file_signature(excel_file):
+                    return cls(excel_file, data['columns'],
+                               {int(key): rows for key, rows in data['rows'].items()},
+                               data['signature'], data['max_row'])
+                logging.info("订单汇总表已被修改，重新建立索引")
+            except (ValueError, KeyError) as e:
+                logging.warning(f"索引文件损坏，重新建立: {str(e)}")
+        index = cls.build(excel_file)
+        index.save()
+        return index
+
+    def save(self, refresh_signature=False):
+        """保存索引；订单汇总表刚被写入时传 refresh_signature=True 记录新的文件状态"""
+        if refresh_signature or self.signature is None:
+            self.signature = file_signature(self.excel_file)
+        data = {
+            'columns': self.columns,
+            'rows': {str(key): rows for key, rows in self.rows.items()},
+            'max_row': self.max_row,
+            'signature': self.signature,
+        }
+        path = index_path(self.excel_file)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, path)
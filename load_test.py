@@ -0,0 +1,252 @@
+"""价格查询的负载测试：对本地模拟站点（mock_ikea）运行 get_product_details 或 update_excel_prices
+
+报告吞吐量、延迟分位数、请求放大倍数（实际发出的请求数 / 查询的商品数）和结果是否正确，
+用来在上线前验证并发数、限速和退避策略的改动。
+
+用法:
+    python load_test.py [--products 200] [--concurrency 8] [--rate 0] [--mode details|excel]
+                        [--latency 0.1 --sigma 0.5] [--p429 0.05] [--p5xx 0.02] [--block-rps 50] [--drip 0.01]
+                        [--duration 600]   # 长时间运行：在这段时间内循环查询同一批商品
+                        [--url http://127.0.0.1:8800/cn/zh/]   # 使用单独启动的模拟站点
+                        [--proxies 4 --proxy-rate 5 --dead-proxies 1 --blocking-proxies 1]   # 经由本地代理池
+"""
+import argparse
+import dataclasses
+import logging
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from fetch_client import FetchClient
+from markets import get_market
+from mock_ikea import MockIkeaServer, StandInProxy, expected_price, unused_proxy_url
+from models import format_product_code
+
+
+def make_product_numbers(count, seed=0):
+    rng = random.Random(seed)
+    return [format_product_code(f"{rng.randint(10_000_000, 99_999_999)}") for _ in range(count)]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def is_correct(details):
+    original, current, on_sale = expected_price(details.product_number)
+    return (details.current_price == current and details.original_price == original
+            and details.is_on_sale == on_sale)
+
+
+def run_details(product_numbers, client, market, concurrency, duration=None):
+    """多个线程同时调用 get_product_details，返回 [(耗时秒, ProductPrice), ...]
+
+    duration 为秒数时在这段时间内循环查询，否则每个货号查询一次。
+    """
+    from update_ikea_prices import get_product_details
+
+    results = []
+    lock = threading.Lock()
+    position = [0]
+    deadline = time.monotonic() + duration if duration else None
+
+    def next_product():
+        with lock:
+            index = position[0]
+            position[0] += 1
+        if deadline is None:
+            return product_numbers[index] if index < len(product_numbers) else None
+        return product_numbers[index % len(product_numbers)] if time.monotonic() < deadline else None
+
+    def worker():
+        while True:
+            product_number = next_product()
+            if product_number is None:
+                return
+            started = time.perf_counter()
+            details = get_product_details(product_number, client, market)
+            elapsed = time.perf_counter() - started
+            with lock:
+                results.append((elapsed, details))
+
+    threads = [threading.Thread(target=worker, name=f"load-{i}") for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_excel(product_numbers, client, market, concurrency=None):
+    """生成一个临时的订单汇总表，用 update_excel_prices 查询并写回，返回 (结果, 表中写对的行数)
+
+    concurrency 为 None 时与 update_excel_prices 的默认行为相同：客户端使用代理池时按代理数并发
+    """
+    import pandas as pd
+    from models import LEDGER_COLUMNS
+    from update_ikea_prices import get_product_details, update_excel_prices
+
+    results = []
+
+    def fetch(product_number):
+        started = time.perf_counter()
+        details = get_product_details(product_number, client, market)
+        results.append((time.perf_counter() - started, details))
+        return details
+
+    with tempfile.TemporaryDirectory() as folder:
+        excel_file = str(Path(folder) / '订单汇总.xlsx')
+        rows = []
+        for i, product_number in enumerate(product_numbers):
+            original, _, _ = expected_price(product_number)
+            rows.append({'订单号': f"LOAD{i // 10:05d}", '商品货号': product_number, '数量': 1,
+                         '商品单价': original, '现价': None, '金额': original, '商品名称与描述': '负载测试'})
+        pd.DataFrame(rows, columns=LEDGER_COLUMNS).to_excel(excel_file, index=False)
+
+        if concurrency is None:
+            concurrency = min(32, len(client.proxy_pool.proxies)) if client.proxy_pool else 1
+        update_excel_prices(excel_file, fetch_details=fetch, concurrency=concurrency)
+
+        written = pd.read_excel(excel_file)
+        correct_rows = sum(1 for product_number, price in zip(written['商品货号'], written['现价'])
+                           if price == expected_price(product_number)[1])
+    return results, correct_rows
+
+
+def report(results, seconds, server_stats, lookups):
+    latencies = sorted(elapsed for elapsed, _ in results)
+    correct = sum(1 for _, details in results if is_correct(details))
+    no_price = sum(1 for _, details in results if details.current_price is None)
+    requests_sent = server_stats.get('requests', 0)
+
+    print(f"\n=== 负载测试结果 ===")
+    print(f"查询商品: {lookups} 次，用时 {seconds:.1f} 秒，吞吐量 {lookups / seconds:.1f} 个/秒")
+    if latencies:
+        print("延迟(ms): " + "  ".join(
+            f"{name} {percentile(latencies, fraction) * 1000:.0f}"
+            for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))))
+    print(f"站点收到请求: {requests_sent} 次，请求放大倍数 {requests_sent / max(lookups, 1):.2f}")
+    print(f"站点响应: " + "  ".join(f"{name} {count}" for name, count in sorted(server_stats.items())
+                                    if name != 'requests'))
+    print(f"结果正确: {correct}/{lookups}（{correct / max(lookups, 1):.1%}），没有价格 {no_price}，"
+          f"价格错误 {lookups - correct - no_price}")
+
+
+def start_proxies(count, dead=0, blocking=0, latency=0.0, block_after=0):
+    """启动本地代理：count 个正常转发，blocking 个在 block_after 次请求后返回拦截页面，
+    另加 dead 个没有服务监听的地址；返回 (代理地址列表, 已启动的代理)"""
+    servers = [StandInProxy(latency=latency) for _ in range(count)]
+    servers += [StandInProxy(latency=latency, block_after=block_after) for _ in range(blocking)]
+    urls = [server.start() for server in servers]
+    urls += [unused_proxy_url() for _ in range(dead)]
+    return urls, servers
+
+
+def report_proxies(proxy_pool, servers):
+    print("\n=== 代理 ===")
+    received = {server.url: server.snapshot_stats() for server in servers}
+    for stats in proxy_pool.stats():
+        proxy_stats = received.get(stats['url'])
+        kind = '掉线' if proxy_stats is None else ('拦截' if proxy_stats.get('blocked') else '正常')
+        print(f"{stats['url']}（{kind}）: 请求 {stats['requests']} 次，错误 {stats['errors']}，"
+              f"拦截 {stats['blocks']}，健康度 {stats['health']}，{'隔离中' if stats['quarantined'] else '可用'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='价格查询负载测试（使用本地模拟站点）')
+    parser.add_argument('--mode', choices=('details', 'excel'), default='details',
+                        help='details: 并发调用 get_product_details；excel: 用 update_excel_prices 更新临时订单汇总表')
+    parser.add_argument('--products', type=int, default=200, help='商品数量')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发线程数（details 模式）')
+    parser.add_argument('--rate', type=float, default=0, help='客户端每秒最多请求次数，0 为不限速')
+    parser.add_argument('--burst', type=int, default=1, help='客户端限速允许的突发请求数')
+    parser.add_argument('--duration', type=float, help='长时间运行的秒数（details 模式），在这段时间内循环查询')
+    parser.add_argument('--url', help='使用单独启动的模拟站点，例如 http://127.0.0.1:8800/cn/zh/（此时下面的站点参数无效）')
+    parser.add_argument('--latency', type=float, default=0.05, help='响应延迟中位数（秒）')
+    parser.add_argument('--sigma', type=float, default=0.5, help='延迟的对数正态分布 sigma，0 为固定延迟')
+    parser.add_argument('--p429', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--p5xx', type=float, default=0.0, help='返回 503 的比例')
+    parser.add_argument('--block-rps', type=float, help='每秒请求超过该数量后返回拦截页面')
+    parser.add_argument('--drip', type=float, default=0.0, help='缓慢发送响应的比例')
+    parser.add_argument('--proxies', type=int, default=0, help='经由本地代理池查询，启动这么多个正常转发的本地代理')
+    parser.add_argument('--proxy-rate', type=float, default=5.0, help='每个代理每秒最多访问的次数')
+    parser.add_argument('--proxy-latency', type=float, default=0.0, help='每个本地代理额外的延迟（秒）')
+    parser.add_argument('--dead-proxies', type=int, default=0, help='另加的掉线代理数（连接被拒绝）')
+    parser.add_argument('--blocking-proxies', type=int, default=0, help='另加的被封代理数（返回拦截页面）')
+    parser.add_argument('--block-after', type=int, default=0, help='被封代理在这么多次请求之后开始返回拦截页面')
+    parser.add_argument('--verbose', action='store_true', help='显示查询过程中的日志')
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        # 每个商品的查询日志很多，测试时只看汇总结果
+        logging.disable(logging.ERROR)
+
+    server = None
+    if args.url:
+        market = dataclasses.replace(get_market('cn'), base_url=args.url)
+    else:
+        server = MockIkeaServer(latency=args.latency, latency_sigma=args.sigma, p429=args.p429, p5xx=args.p5xx,
+                                block_rps=args.block_rps, p_drip=args.drip)
+        server.start()
+        market = server.market()
+    print(f"模拟站点: {market.base_url}")
+
+    def server_stats():
+        if server is not None:
+            return server.snapshot_stats()
+        import json
+        from urllib.request import urlopen
+
+        root = market.base_url.split('/cn/')[0]
+        with urlopen(f"{root}/__mock__/stats") as response:
+            return json.loads(response.read())
+
+    def reset_stats():
+        if server is not None:
+            server.reset_stats()
+        else:
+            from urllib.request import urlopen
+
+            urlopen(f"{market.base_url.split('/cn/')[0]}/__mock__/reset").close()
+
+    product_numbers = make_product_numbers(args.products)
+    proxy_pool = None
+    proxy_servers = []
+    if args.proxies or args.dead_proxies or args.blocking_proxies:
+        from proxy_pool import ProxyPool
+
+        proxy_urls, proxy_servers = start_proxies(args.proxies, args.dead_proxies, args.blocking_proxies,
+                                                  args.proxy_latency, args.block_after)
+        proxy_pool = ProxyPool(proxy_urls, rate=args.proxy_rate)
+        print(f"本地代理: {args.proxies} 个正常，{args.blocking_proxies} 个被封，{args.dead_proxies} 个掉线，"
+              f"每个代理每秒最多 {args.proxy_rate} 次")
+    client = FetchClient(rate=args.rate or None, burst=args.burst, proxy_pool=proxy_pool,
+                         pool_size=max(10, args.concurrency, len(proxy_pool.proxies) if proxy_pool else 0))
+    reset_stats()
+    started = time.perf_counter()
+    try:
+        if args.mode == 'details':
+            results = run_details(product_numbers, client, market, args.concurrency, args.duration)
+            correct_rows = None
+        else:
+            results, correct_rows = run_excel(product_numbers, client, market)
+        seconds = time.perf_counter() - started
+        report(results, seconds, server_stats(), len(results))
+        if correct_rows is not None:
+            print(f"订单汇总表中现价正确的行: {correct_rows}/{len(product_numbers)}")
+        if proxy_pool is not None:
+            report_proxies(proxy_pool, proxy_servers)
+    finally:
+        client.close()
+        for proxy_server in proxy_servers:
+            proxy_server.stop()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
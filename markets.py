@@ -0,0 +1,166 @@
+import logging
+import re
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+
+@dataclass(frozen=True)
+class Market:
+    """一个宜家国家/地区站点：网址、货币、数字格式和促销标签"""
+    code: str
+    name: str
+    base_url: str
+    currency: str
+    currency_symbol: str
+    # 货币符号在数字前面（¥1,499.00）还是后面（1.499,00 €）
+    symbol_first: bool = True
+    thousands_sep: str = ','
+    decimal_sep: str = '.'
+    language: str = 'zh-CN'
+    search_path: str = 'search/?q={query}'
+    sale_indicators: tuple = ()
+    # 匹配优惠有效期的正则，第1、2组为开始和结束日期（年.月.日）；没有时不提取
+    promo_pattern: str = None
+
+    @property
+    def host(self):
+        return urlparse(self.base_url).netloc
+
+    @property
+    def accept_language(self):
+        primary = self.language.split('-')[0]
+        return f"{self.language},{primary};q=0.9,en;q=0.8"
+
+    @property
+    def price_pattern(self):
+        """匹配页面中带货币符号的价格，第1组为数字部分"""
+        symbol = re.escape(self.currency_symbol)
+        number = rf"\d[\d{re.escape(self.thousands_sep)}]*(?:{re.escape(self.decimal_sep)}\d{{2}})?"
+        if self.symbol_first:
+            return rf"{symbol}\s*({number})"
+        return rf"({number})\s*{symbol}"
+
+    def parse_number(self, text):
+        """把本地格式的价格数字转换为浮点数，例如 1.499,00 -> 1499.0"""
+        for sep in self.thousands_sep:
+            text = text.replace(sep, '')
+        return float(text.replace(self.decimal_sep, '.'))
+
+    def parse_promo_window(self, html_text):
+        """提取优惠有效期，返回 (开始日期, 结束日期) 的ISO格式字符串；找不到时返回 (None, None)"""
+        if not self.promo_pattern:
+            return None, None
+        match = re.search(self.promo_pattern, html_text)
+        if not match:
+            return None, None
+        dates = []
+        for text in match.groups():
+            year, month, day = (int(part) for part in re.split(r'[./-]', text))
+            dates.append(f"{year:04d}-{month:02d}-{day:02d}")
+        return tuple(dates)
+
+    def search_url(self, query):
+        return self.base_url + self.search_path.format(query=query)
+
+    def product_url(self, clean_number):
+        return f"{self.base_url}p/-{clean_number}/"
+
+    def product_urls(self, original_format, clean_number):
+        """依次尝试的页面: 原始格式搜索、纯数字搜索、商品页"""
+        return [
+            self.search_url(original_format),
+            self.search_url(clean_number),
+            self.product_url(clean_number),
+        ]
+
+
+ENGLISH_SALE_INDICATORS = ("New lower price", "Lower price", "Limited time offer", "IKEA Family price", "Offer")
+
+MARKETS = {
+    'cn': Market('cn', '中国', 'https://www.ikea.cn/cn/zh/', 'CNY', '¥',
+                 search_path='search/products/?q={query}&qtype=search_keywords',
+                 sale_indicators=("优惠有效期", "更低价格", "会员价", "限时", "促销", "特价"),
+                 promo_pattern=r'优惠有效期\s*(\d{4}[./-]\d{1,2}[./-]\d{1,2})\s*至\s*(\d{4}[./-]\d{1,2}[./-]\d{1,2})'),
+    'us': Market('us', '美国', 'https://www.ikea.com/us/en/', 'USD', '$',
+                 language='en-US', sale_indicators=ENGLISH_SALE_INDICATORS),
+    'gb': Market('gb', '英国', 'https://www.ikea.com/gb/en/', 'GBP', '£',
+                 language='en-GB', sale_indicators=ENGLISH_SALE_INDICATORS),
+    'de': Market('de', '德国', 'https://www.ikea.com/de/de/', 'EUR', '€', symbol_first=False,
+                 thousands_sep='.', decimal_sep=',', language='de-DE',
+                 sale_indicators=("Neuer niedrigerer Preis", "Niedrigerer Preis", "IKEA Family Preis", "Angebot")),
+    'se': Market('se', '瑞典', 'https://www.ikea.com/se/sv/', 'SEK', 'kr', symbol_first=False,
+                 thousands_sep=' \xa0', decimal_sep=',', language='sv-SE',
+                 sale_indicators=("Nytt lägre pris", "Lägre pris", "IKEA Family-pris", "Erbjudande")),
+    'jp': Market('jp', '日本', 'https://www.ikea.com/jp/ja/', 'JPY', '¥', language='ja-JP',
+                 sale_indicators=("新しい低価格", "期間限定", "IKEA Family価格")),
+}
+
+DEFAULT_MARKET = MARKETS['cn']
+
+
+def get_market(market=None):
+    """按代码（如 'de'）取得站点；传入 Market 时原样返回，不传时为中国站"""
+    if market is None:
+        return DEFAULT_MARKET
+    if isinstance(market, Market):
+        return market
+    try:
+        return MARKETS[market.lower()]
+    except KeyError:
+        raise ValueError(f"未知的站点: {market}，可选: {', '.join(MARKETS)}")
+
+
+def compare_markets(product_numbers, markets=None, rates=None, rate=0.5, burst=1, clients=None, max_workers=None):
+    """在多个站点同时查询同一批商品，返回跨站点的价格矩阵（pandas.DataFrame）
+
+    每个站点（按域名）使用一个独立限速的 FetchClient，不同站点的请求并发进行，
+    同一站点仍按 rate 限速。rates 为各货币折算成同一种货币的汇率，例如
+    {'CNY': 1, 'EUR': 7.8, 'USD': 7.2}；给出时增加折算后的价格和最低价站点。
+
+    结果每行一个货号，列为 "<站点>" 本地现价，以及（有汇率时）"<站点>_折算"、"最低价站点"。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import pandas as pd
+    from fetch_client import FetchClient
+    from update_ikea_prices import get_product_details
+
+    markets = [get_market(market) for market in markets or MARKETS]
+    clients = dict(clients or {})
+    created = []
+    for market in markets:
+        if market.host not in clients:
+            clients[market.host] = FetchClient(rate=rate, burst=burst)
+            created.append(clients[market.host])
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or len(markets) * 2) as executor:
+            futures = {
+                (product_number, market.code): executor.submit(
+                    get_product_details, product_number, clients[market.host], market)
+                for product_number in product_numbers
+                for market in markets
+            }
+            results = {key: future.result() for key, future in futures.items()}
+    finally:
+        for client in created:
+            client.close()
+
+    rows = []
+    for product_number in product_numbers:
+        row = {'商品货号': product_number}
+        for market in markets:
+            row[market.code] = results[(product_number, market.code)].current_price
+        if rates:
+            converted = {}
+            for market in markets:
+                price = row[market.code]
+                if price is not None and market.currency in rates:
+                    converted[market.code] = price * rates[market.currency]
+                row[f"{market.code}_折算"] = converted.get(market.code)
+            row['最低价站点'] = min(converted, key=converted.get) if converted else None
+        rows.append(row)
+
+    found = sum(1 for details in results.values() if details.current_price is not None)
+    logging.info(f"跨站点查询完成: {len(product_numbers)} 个商品 x {len(markets)} 个站点，{found} 个有价格")
+    return pd.DataFrame(rows).set_index('商品货号')
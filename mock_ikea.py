@@ -0,0 +1,471 @@
+"""本地模拟的宜家中国站，用于负载、长时间运行和限流场景测试
+
+商品页和搜索页按保存下来的页面（ikea_*.html）的价格区块结构生成，每个货号的原价、现价、
+是否促销由货号确定（见 expected_price），测试程序可以据此检查解析结果是否正确。
+首页带有分类链接，分类列表页（/cat/分类/?page=N）每页若干个商品卡片，用于测试目录快照（catalog_snapshot）。
+可以配置响应延迟分布、429/5xx 错误比例、每秒请求超过一定数量后返回拦截页面，以及缓慢逐段发送的响应；
+--script 时价格区块由页面中的脚本插入，直接解析HTML找不到价格，用于测试无头浏览器渲染（render_fallback）。
+
+还可以作为代理池测试用的本地代理（--proxy）：把收到的请求转发到目标地址，
+可以设置代理自己的延迟，或者在一定请求数之后对所有请求返回拦截页面（模拟出口IP被封）。
+
+用法:
+    python mock_ikea.py [--port 8800] [--latency 0.2 --sigma 0.5] [--p429 0.05] [--p5xx 0.02]
+                        [--block-rps 20] [--drip 0.01] [--script]
+    python mock_ikea.py --proxy --port 8901 [--latency 0.05] [--block-after 100]
+
+    GET /cn/zh/                      首页，带分类链接
+    GET /cn/zh/cat/<分类>/?page=N    分类列表页，翻过最后一页后没有商品
+    GET /__mock__/stats   请求统计（JSON）
+    GET /__mock__/reset   清空统计
+"""
+import argparse
+import dataclasses
+import http.client
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from markets import get_market
+from models import format_product_code, product_key
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# 与保存的商品页大小相近（ikea_20571800.html 约 70 万字符）
+DEFAULT_PAGE_SIZE = 700_000
+
+BLOCK_PAGE = ('<!DOCTYPE html><html><head><title>访问验证 - IKEA</title></head><body>'
+              '<div class="verify">访问过于频繁，请完成验证码验证后继续访问</div></body></html>')
+
+PRICE_BLOCK = (
+    '<div class="i-product-price i-product-price--reverse i-product-price--medium">{original}'
+    '<div class="i-product-price--main"><span aria-label="¥ {current:.2f}" class="i-price i-price--leading '
+    'i-price--medium i-price--color--primary"><span class="i-price__currency">¥</span>'
+    '<span class="i-price__integer">{current_integer}</span><span class="i-price__decimal">'
+    '<span class="i-price__separator">.</span><span>{current_decimal}</span></span></span></div>{tips}</div>'
+)
+ORIGINAL_PRICE = (
+    '<div class="i-product-price__original"><span aria-label="¥ {price:.2f}" class="i-price i-price--small '
+    'i-price--color--tertiary"><span class="i-product-price__tips prefix">非会员价 </span>'
+    '<span class="i-price__currency">¥</span><span class="i-price__integer">{integer}</span>'
+    '<span class="i-price__decimal"><span class="i-price__separator">.</span><span>{decimal}</span></span></span></div>'
+)
+PROMO_TIPS = '<p class="price__tips">优惠有效期 {start} 至 {end}</p>'
+# 填充内容模仿页面中由 JavaScript 渲染的占位区块，不含价格
+SKELETON = '<div class="right w-20%"><div class="common-skeleton" data-v-044f5b03></div></div>\n'
+# 列表页的商品卡片：图片和标题都链接到商品页，价格区块与商品页相同
+PRODUCT_CARD = (
+    '<div class="product-compact" data-product-number="{code}">'
+    '<a href="/cn/zh/p/mock-product-{digits}/" class="product-compact__image"><img src="/images/{digits}.jpg" alt=""></a>'
+    '<a href="/cn/zh/p/mock-product-{digits}/"><span class="product-compact__name">商品 {code}</span></a>'
+    '{price}</div>\n'
+)
+CATEGORIES = ('chuang-he-chuang-dian-tl001', 'fang-zhi-pin-tl002', 'deng-ju-zhao-ming-tl003')
+# 每个分类的商品数和列表页每页的商品数
+CATEGORY_SIZE = 60
+LISTING_PAGE_SIZE = 24
+
+
+def expected_price(product_number):
+    """模拟站点上某个货号的价格: (原价, 现价, 是否促销)，同一个货号总是相同"""
+    rng = random.Random(product_key(product_number))
+    original = float(rng.randint(19, 2999))
+    if rng.random() < 0.3:
+        current = float(round(original * rng.uniform(0.5, 0.9)))
+        return original, current, True
+    return original, original, False
+
+
+def render_price_block(product_number):
+    """商品的价格区块HTML，促销商品带原价和优惠有效期"""
+    original, current, on_sale = expected_price(product_number)
+
+    def split(price):
+        integer, decimal = f"{price:.2f}".split('.')
+        return integer, decimal
+
+    current_integer, current_decimal = split(current)
+    original_block = ''
+    tips = ''
+    if on_sale:
+        integer, decimal = split(original)
+        original_block = ORIGINAL_PRICE.format(price=original, integer=integer, decimal=decimal)
+        tips = PROMO_TIPS.format(start='2025.04.01', end='2025.05.06')
+    return PRICE_BLOCK.format(original=original_block, current=current, current_integer=current_integer,
+                              current_decimal=current_decimal, tips=tips)
+
+
+def render_product_page(product_number, page_size=DEFAULT_PAGE_SIZE, padding=None, script=False):
+    """生成商品页HTML，价格区块的结构与真实页面相同
+
+    script=True 时价格区块不在HTML中，由页面加载后执行的脚本插入（模拟由 JavaScript 渲染的价格）
+    """
+    code = format_product_code(product_number)
+    price_block = render_price_block(product_number)
+    tail = '</body></html>'
+    if script:
+        # 货币符号转义为 \u00a5，脚本执行前HTML中没有可以解析的价格
+        tail = (f'<script>document.getElementById("price-slot").outerHTML = {json.dumps(price_block)};</script>'
+                + tail)
+        price_block = '<div id="price-slot"></div>'
+    head = (f'<!DOCTYPE html><html><head><title>商品 {code} - IKEA</title></head><body>'
+            f'<div class="pip-product" data-product-number="{code}">' + price_block + '</div>')
+    if padding is None:
+        padding = SKELETON * max(0, (page_size - len(head)) // len(SKELETON))
+    return head + padding + tail
+
+
+def category_products(category):
+    """分类中的商品货号（8位数字），同一个分类总是相同"""
+    rng = random.Random(category)
+    return [f"{rng.randint(10000000, 99999999):08d}" for _ in range(CATEGORY_SIZE)]
+
+
+def render_listing_page(category, page=1):
+    """生成分类列表页HTML；page 超过最后一页时没有商品卡片"""
+    products = category_products(category)[(page - 1) * LISTING_PAGE_SIZE:page * LISTING_PAGE_SIZE]
+    cards = ''.join(PRODUCT_CARD.format(code=format_product_code(digits), digits=digits,
+                                        price=render_price_block(digits))
+                    for digits in products)
+    return (f'<!DOCTYPE html><html><head><title>{category} - IKEA</title></head><body>'
+            f'<div class="plp-product-list" data-category="{category}" data-page="{page}">{cards}</div>'
+            '</body></html>')
+
+
+def render_home_page():
+    links = ''.join(f'<a href="/cn/zh/cat/{category}/">{category}</a>' for category in CATEGORIES)
+    return f'<!DOCTYPE html><html><head><title>IKEA</title></head><body><nav>{links}</nav></body></html>'
+
+
+class MockIkeaHandler(BaseHTTPRequestHandler):
+    # 使用长连接，与真实站点一样可以复用连接
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        if url.path == '/__mock__/stats':
+            self._send(200, json.dumps(server.snapshot_stats(), ensure_ascii=False), 'application/json')
+            return
+        if url.path == '/__mock__/reset':
+            server.reset_stats()
+            self._send(200, '{}', 'application/json')
+            return
+
+        server.count('requests')
+        blocked = server.over_block_rate()
+        delay = server.sample_latency()
+        if delay:
+            time.sleep(delay)
+
+        if blocked:
+            server.count('blocked')
+            self._send(200, BLOCK_PAGE)
+            return
+        roll = server.rng_random()
+        if roll < server.p429:
+            server.count('status_429')
+            self._send(429, 'Too Many Requests', headers={'Retry-After': '1'})
+            return
+        if roll < server.p429 + server.p5xx:
+            server.count('status_5xx')
+            self._send(503, 'Service Unavailable')
+            return
+
+        listing = self._listing_page(url)
+        if listing is not None:
+            server.count('status_200')
+            self._send(200, listing)
+            return
+        product_number = self._product_number(url)
+        if product_number is None:
+            server.count('status_404')
+            self._send(404, '<html><body>页面不存在</body></html>')
+            return
+        server.count('status_200')
+        self._send(200, render_product_page(product_number, padding=server.padding, script=server.script),
+                   drip=server.rng_random() < server.p_drip)
+
+    def _listing_page(self, url):
+        """首页和分类列表页的HTML；其他地址返回 None"""
+        if url.path == '/cn/zh/':
+            return render_home_page()
+        match = re.fullmatch(r'/cn/zh/cat/([^/]+)/', url.path)
+        if not match:
+            return None
+        page = parse_qs(url.query).get('page', ['1'])[0]
+        return render_listing_page(match.group(1), int(page) if page.isdigit() else 1)
+
+    def _product_number(self, url):
+        """搜索页（?q=货号）和商品页（/p/...-货号/）都返回该商品的价格"""
+        if '/search/' in url.path:
+            query = parse_qs(url.query).get('q', [''])[0]
+            digits = re.sub(r'\D', '', query)
+            return digits if len(digits) == 8 else None
+        match = re.search(r'/p/[^/]*?(\d{8})/?$', url.path)
+        return match.group(1) if match else None
+
+    def _send(self, status, text, content_type='text/html', headers=None, drip=False):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not drip:
+            self.wfile.write(body)
+            return
+        # 缓慢逐段发送：每段之间等待，模拟网络很慢或服务器逐步输出
+        self.server.count('dripped')
+        chunk = self.server.drip_chunk
+        for start in range(0, len(body), chunk):
+            self.wfile.write(body[start:start + chunk])
+            self.wfile.flush()
+            time.sleep(self.server.drip_delay)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+class MockIkeaServer(ThreadingHTTPServer):
+    """模拟站点服务器
+
+    latency / latency_sigma: 响应延迟（秒）的中位数和对数正态分布的 sigma，sigma 为 0 时固定延迟
+    p429 / p5xx: 返回 429、503 的比例
+    block_rps: 最近一秒内的请求数超过该值时返回拦截页面（200 + 验证码提示），None 为不拦截
+    p_drip: 缓慢发送响应的比例，每 drip_delay 秒发送 drip_chunk 字节
+    script: 价格区块由页面脚本插入（见 render_product_page）
+    """
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, latency_sigma=0.0, p429=0.0, p5xx=0.0,
+                 block_rps=None, p_drip=0.0, drip_chunk=16384, drip_delay=0.05, page_size=DEFAULT_PAGE_SIZE,
+                 seed=0, script=False):
+        super().__init__((host, port), MockIkeaHandler)
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.p429 = p429
+        self.p5xx = p5xx
+        self.block_rps = block_rps
+        self.p_drip = p_drip
+        self.drip_chunk = drip_chunk
+        self.drip_delay = drip_delay
+        self.script = script
+        # 所有页面共用同一段填充内容，生成页面时只需拼接
+        self.padding = SKELETON * (page_size // len(SKELETON))
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.thread = None
+        self.reset_stats()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/cn/zh/"
+
+    def market(self):
+        """指向本服务器的中国站配置，传给 get_product_details 使用"""
+        return dataclasses.replace(get_market('cn'), base_url=self.base_url)
+
+    def rng_random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def sample_latency(self):
+        if not self.latency:
+            return 0.0
+        if not self.latency_sigma:
+            return self.latency
+        with self.lock:
+            return self.rng.lognormvariate(0, self.latency_sigma) * self.latency
+
+    def over_block_rate(self):
+        """记录这次请求，并判断最近一秒内的请求数是否超过 block_rps"""
+        if self.block_rps is None:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self.recent.append(now)
+            while self.recent and self.recent[0] < now - 1:
+                self.recent.popleft()
+            return len(self.recent) > self.block_rps
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0}
+
+    def snapshot_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def start(self):
+        """在后台线程中运行，返回站点根地址"""
+        self.thread = threading.Thread(target=self.serve_forever, name="mock-ikea", daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInProxyHandler(BaseHTTPRequestHandler):
+    """转发绝对地址形式的请求（GET http://host:port/path），只支持 http 目标"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        if server.latency:
+            time.sleep(server.latency)
+        if server.block_after is not None and server.snapshot_stats()['requests'] > server.block_after:
+            server.count('blocked')
+            self._send(200, BLOCK_PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+            return
+
+        url = urlparse(self.path)
+        if url.scheme != 'http' or not url.hostname:
+            server.count('bad_request')
+            self._send(400, b'absolute http URL required', 'text/plain')
+            return
+        headers = {name: value for name, value in self.headers.items()
+                   if name.lower() not in ('proxy-connection', 'connection', 'host')}
+        path = url.path + (f"?{url.query}" if url.query else '')
+        try:
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+            content_type = response.getheader('Content-Type', 'text/html')
+            status = response.status
+            connection.close()
+        except Exception as e:
+            server.count('upstream_errors')
+            self._send(502, f'upstream error: {e}'.encode('utf-8'), 'text/plain')
+            return
+        server.count('forwarded')
+        self._send(status, body, content_type)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+class StandInProxy(ThreadingHTTPServer):
+    """代理池测试用的本地代理
+
+    latency: 每个请求额外的延迟（秒）
+    block_after: 收到的请求数超过该值后，对所有请求返回拦截页面，None 为不拦截
+    """
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, block_after=None):
+        super().__init__((host, port), StandInProxyHandler)
+        self.latency = latency
+        self.block_after = block_after
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0}
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def snapshot_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def start(self):
+        """在后台线程中运行，返回代理地址"""
+        self.thread = threading.Thread(target=self.serve_forever, name="stand-in-proxy", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def unused_proxy_url(host='127.0.0.1'):
+    """一个没有服务监听的地址，用作掉线的代理（连接被拒绝）"""
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        port = sock.getsockname()[1]
+    return f"http://{host}:{port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地模拟的宜家中国站')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8800, help='监听端口')
+    parser.add_argument('--latency', type=float, default=0.0, help='响应延迟中位数（秒）')
+    parser.add_argument('--sigma', type=float, default=0.0, help='延迟的对数正态分布 sigma，0 为固定延迟')
+    parser.add_argument('--p429', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--p5xx', type=float, default=0.0, help='返回 503 的比例')
+    parser.add_argument('--block-rps', type=float, help='每秒请求超过该数量后返回拦截页面')
+    parser.add_argument('--drip', type=float, default=0.0, help='缓慢发送响应的比例')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='页面大小（字符）')
+    parser.add_argument('--script', action='store_true', help='价格区块由页面脚本插入，用于测试无头浏览器渲染')
+    parser.add_argument('--proxy', action='store_true', help='作为代理池测试用的本地代理运行，转发请求到目标地址')
+    parser.add_argument('--block-after', type=int, help='代理模式：收到的请求数超过该值后返回拦截页面')
+    args = parser.parse_args(argv)
+
+    if args.proxy:
+        server = StandInProxy(args.host, args.port, latency=args.latency, block_after=args.block_after)
+        logging.info(f"本地代理已启动: {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    server = MockIkeaServer(args.host, args.port, latency=args.latency, latency_sigma=args.sigma, p429=args.p429,
+                            p5xx=args.p5xx, block_rps=args.block_rps, p_drip=args.drip, page_size=args.page_size,
+                            script=args.script)
+    logging.info(f"模拟站点已启动: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
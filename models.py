@@ -0,0 +1,100 @@
+from dataclasses import asdict, dataclass
+
+# 订单汇总表的列顺序
+LEDGER_COLUMNS = ['订单号', '商品货号', '数量', '商品单价', '现价', '金额', '商品名称与描述']
+
+
+def product_code_text(product_number):
+    """货号的文本形式；整数值的浮点数按整数处理
+
+    货号列中有空单元格时 pandas 会把整列读成 float64，70531656 变成 70531656.0，
+    直接去掉非数字字符会多出一个 0。
+    """
+    if isinstance(product_number, float) and product_number.is_integer():
+        return str(int(product_number))
+    return str(product_number)
+
+
+def product_key(product_number):
+    """把商品货号转换为整数键，例如 705.316.56 -> 70531656
+
+    宜家货号固定为8位数字，转换为整数后可以无损还原（见 format_product_code），
+    用整数作键比字符串更省内存，比对和关联也更快。
+    """
+    if product_number is None:
+        return None
+    digits = ''.join(filter(str.isdigit, product_code_text(product_number)))
+    return int(digits) if digits else None
+
+
+def format_product_code(key):
+    """把整数键还原为带点的货号格式，例如 70531656 -> 705.316.56"""
+    digits = f"{int(key):08d}"
+    return f"{digits[:3]}.{digits[3:6]}.{digits[6:]}"
+
+
+@dataclass(slots=True)
+class ProductPrice:
+    """一次价格查询的结果"""
+    product_number: str
+    original_price: float = None
+    current_price: float = None
+    is_on_sale: bool = False
+    url: str = None
+    # 查询的站点代码（见 markets），价格为该站点的本地货币
+    market: str = 'cn'
+    # 页面上的优惠有效期（ISO日期，如 2025-05-06），没有时为 None
+    promo_start: str = None
+    promo_end: str = None
+
+    @property
+    def key(self):
+        return product_key(self.product_number)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            product_number=data.get('product_number'),
+            original_price=data.get('original_price'),
+            current_price=data.get('current_price'),
+            is_on_sale=bool(data.get('is_on_sale')),
+            url=data.get('url'),
+            market=data.get('market') or 'cn',
+            promo_start=data.get('promo_start'),
+            promo_end=data.get('promo_end'),
+        )
+
+
+@dataclass(slots=True)
+class OrderLine:
+    """订单中的一行商品"""
+    order_number: str
+    product_code: str
+    quantity: int = 1
+    unit_price: float = 0.0
+    amount: float = 0.0
+    description: str = ""
+    current_price: float = None
+
+    @property
+    def key(self):
+        return product_key(self.product_code)
+
+
+def order_lines_to_frame(lines):
+    """按列把订单行转换为订单汇总表格式的DataFrame"""
+    import numpy as np
+    import pandas as pd
+
+    return pd.DataFrame({
+        '订单号': [line.order_number for line in lines],
+        '商品货号': [line.product_code for line in lines],
+        '数量': np.fromiter((line.quantity for line in lines), dtype=np.int64, count=len(lines)),
+        '商品单价': np.fromiter((line.unit_price for line in lines), dtype=np.float64, count=len(lines)),
+        '现价': ["" if line.current_price is None else line.current_price for line in lines],
+        '金额': np.fromiter((line.amount for line in lines), dtype=np.float64, count=len(lines)),
+        '商品名称与描述': [line.description for line in lines],
+    }, columns=LEDGER_COLUMNS)
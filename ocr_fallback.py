@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# OCR识别使用的语言和分辨率（需要安装 Tesseract 及其 chi_sim 语言包）
+OCR_LANG = 'chi_sim+eng'
+OCR_RESOLUTION = 300
+# --psm 6: 把页面当作一整块文本，能保持购物凭证表格的行结构
+OCR_CONFIG = '--psm 6'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def default_cache_dir(pdf_path):
+    """OCR结果默认缓存在PDF所在文件夹的 .ocr_cache 目录下"""
+    return Path(pdf_path).parent / '.ocr_cache'
+
+
+def get_pool(max_workers=None):
+    """进程内共用的OCR进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _ocr_page(pdf_path, page_index, cache_dir):
+    """在子进程中渲染一页并识别文字，以页面图像的哈希缓存识别结果"""
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        image = pdf.pages[page_index].to_image(resolution=OCR_RESOLUTION).original
+
+    page_hash = hashlib.sha256(image.tobytes()).hexdigest()
+    cache_file = Path(cache_dir) / f"{page_hash}.txt" if cache_dir else None
+    if cache_file and cache_file.exists():
+        return cache_file.read_text(encoding='utf-8')
+
+    import pytesseract
+
+    text = pytesseract.image_to_string(image, lang=OCR_LANG, config=OCR_CONFIG)
+    if cache_file:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+        tmp_file.write_text(text, encoding='utf-8')
+        os.replace(tmp_file, cache_file)
+    return text
+
+
+def submit_pdf(pdf_path, cache_dir=None, executor=None):
+    """把一个PDF的所有页面提交到进程池识别，返回按页顺序排列的 Future 列表"""
+    import pdfplumber
+
+    try:
+        import pytesseract  # noqa: F401
+    except ImportError:
+        raise ImportError("OCR识别需要先安装 pytesseract 和 Tesseract: pip install pytesseract")
+
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+
+    cache_dir = str(cache_dir or default_cache_dir(pdf_path))
+    executor = executor or get_pool()
+    return [executor.submit(_ocr_page, str(pdf_path), i, cache_dir) for i in range(page_count)]
+
+
+def ocr_pdf_text(pdf_path, cache_dir=None, executor=None):
+    """识别扫描版PDF的全部页面，返回拼接后的文字"""
+    futures = submit_pdf(pdf_path, cache_dir, executor)
+    return '\n'.join(future.result() for future in futures)
+
+
+def ocr_pdfs(pdf_paths, cache_dir=None, executor=None):
+    """把一批扫描版PDF的所有页面一次性提交到进程池识别，多个文件的页面并行处理
+
+    返回 {pdf_path: 拼接后的文字}；某个文件识别失败时值为 None。
+    调用方应只传入已确认没有文本层的文件（见 pdf_excel.extract_order_info 的 scans 参数）。
+    """
+    submitted = {}
+    for pdf_path in pdf_paths:
+        try:
+            submitted[pdf_path] = submit_pdf(pdf_path, cache_dir, executor)
+        except ImportError:
+            raise
+        except Exception as e:
+            logging.warning(f"提交文件 {pdf_path} 进行OCR识别时出错: {str(e)}")
+            submitted[pdf_path] = None
+
+    texts = {}
+    for pdf_path, futures in submitted.items():
+        if futures is None:
+            texts[pdf_path] = None
+            continue
+        try:
+            texts[pdf_path] = '\n'.join(future.result() for future in futures)
+        except Exception as e:
+            logging.warning(f"文件 {pdf_path} OCR识别失败: {str(e)}")
+            texts[pdf_path] = None
+    return texts
@@ -0,0 +1,217 @@
+import atexit
+import gzip
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from models import product_key
+
+PACK_FILE = 'pages.pack'
+INDEX_FILE = 'index.db'
+CODECS = ('gzip', 'zstd')
+
+
+def _compressor(codec, level=None):
+    if codec == 'gzip':
+        return lambda data: gzip.compress(data, compresslevel=level or 6)
+    if codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("使用 zstd 压缩需要安装 zstandard: pip install zstandard")
+        compressor = zstandard.ZstdCompressor(level=level or 10)
+        return compressor.compress
+    raise ValueError(f"未知的压缩方式: {codec}，可选: {', '.join(CODECS)}")
+
+
+def _decompress(codec, blob):
+    if codec == 'gzip':
+        return gzip.decompress(blob)
+    if codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("读取 zstd 压缩的页面需要安装 zstandard: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    raise ValueError(f"未知的压缩方式: {codec}")
+
+
+class PageArchive:
+    """页面存档：把抓取到的页面压缩后追加到一个数据包文件，相同内容只保存一次
+
+    目录中有两个文件：
+    - pages.pack: 只追加的数据包，每个页面压缩后连续写入
+    - index.db:   SQLite索引，blobs 表按内容哈希（sha256）记录页面在数据包中的位置，
+                  captures 表按商品和时间记录每次抓取对应的内容哈希
+
+    put() 只把页面放入队列，压缩和写盘由后台线程完成，不影响抓取速度；
+    队列满时丢弃页面并计数（存档只用于调试，不能反过来拖慢查询）。
+    """
+
+    def __init__(self, directory, codec='gzip', level=None, queue_size=1000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.codec = codec
+        self.compress = _compressor(codec, level)
+        self.pack_path = self.directory / PACK_FILE
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.directory / INDEX_FILE), check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                offset INTEGER,
+                length INTEGER,
+                size INTEGER,
+                codec TEXT
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS captures (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key INTEGER,
+                product_number TEXT,
+                url TEXT,
+                status INTEGER,
+                fetched_at REAL,
+                hash TEXT
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS captures_key ON captures (key, fetched_at)')
+        self.conn.commit()
+
+        # 上次异常退出时数据包末尾可能有未写入索引的内容，新内容从文件末尾继续追加，不影响已有记录
+        self.pack = open(self.pack_path, 'ab')
+        self.stats = {'queued': 0, 'written': 0, 'deduplicated': 0, 'dropped': 0, 'errors': 0,
+                      'bytes_in': 0, 'bytes_out': 0}
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.writer = threading.Thread(target=self._run, name="page-archive-writer", daemon=True)
+        self.writer.start()
+        self.closed = False
+
+    def put(self, product_number, url, html_text, status=200, fetched_at=None):
+        """把一次抓取的页面交给后台线程存档，立即返回；队列满时丢弃并返回 False"""
+        try:
+            self.queue.put_nowait((product_number, url, html_text, status, fetched_at or time.time()))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['queued'] += 1
+        return True
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._store(*item)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logging.error("页面存档写入失败: %s", e)
+            finally:
+                self.queue.task_done()
+
+    def _store(self, product_number, url, html_text, status, fetched_at):
+        data = html_text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            exists = self.conn.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)).fetchone()
+        if exists:
+            self.stats['deduplicated'] += 1
+        else:
+            blob = self.compress(data)
+            with self.lock:
+                offset = self.pack.tell()
+                self.pack.write(blob)
+                # 先写数据包再写索引，索引中的记录总能在数据包中找到
+                self.pack.flush()
+                self.conn.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?)',
+                                  (digest, offset, len(blob), len(data), self.codec))
+            self.stats['written'] += 1
+            self.stats['bytes_in'] += len(data)
+            self.stats['bytes_out'] += len(blob)
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO captures (key, product_number, url, status, fetched_at, hash) VALUES (?, ?, ?, ?, ?, ?)',
+                (product_key(product_number), product_number, url, status, fetched_at, digest))
+            self.conn.commit()
+
+    def flush(self):
+        """等待队列中的页面全部写完并同步到磁盘"""
+        self.queue.join()
+        with self.lock:
+            self.pack.flush()
+            os.fsync(self.pack.fileno())
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join()
+        with self.lock:
+            self.pack.flush()
+            os.fsync(self.pack.fileno())
+            self.pack.close()
+            self.conn.close()
+        logging.info(f"页面存档已关闭: {self.stats}")
+
+    def read(self, digest):
+        """按内容哈希读取页面HTML；不存在时返回 None"""
+        with self.lock:
+            row = self.conn.execute('SELECT offset, length, codec FROM blobs WHERE hash = ?', (digest,)).fetchone()
+        if not row:
+            return None
+        offset, length, codec = row
+        with open(self.pack_path, 'rb') as f:
+            f.seek(offset)
+            blob = f.read(length)
+        return _decompress(codec, blob).decode('utf-8')
+
+    def captures(self, product_number, limit=None):
+        """某个商品的抓取记录，最新的在前: [{'fetched_at', 'url', 'status', 'hash'}, ...]"""
+        sql = 'SELECT fetched_at, url, status, hash FROM captures WHERE key = ? ORDER BY fetched_at DESC'
+        params = [product_key(product_number)]
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(zip(('fetched_at', 'url', 'status', 'hash'), row)) for row in rows]
+
+    def latest(self, product_number):
+        """某个商品最近一次抓取的页面HTML；没有记录时返回 None"""
+        captures = self.captures(product_number, limit=1)
+        return self.read(captures[0]['hash']) if captures else None
+
+    def pages(self, product_number, limit=None):
+        """依次返回某个商品历次抓取的 (记录, HTML)，最新的在前"""
+        for capture in self.captures(product_number, limit):
+            yield capture, self.read(capture['hash'])
+
+
+_default_archive = None
+_default_archive_lock = threading.Lock()
+
+
+def configure_archive(directory, **kwargs):
+    """打开进程内共用的页面存档（参数同 PageArchive），进程退出时自动写完并关闭"""
+    global _default_archive
+    with _default_archive_lock:
+        if _default_archive is not None:
+            _default_archive.close()
+        _default_archive = PageArchive(directory, **kwargs)
+        atexit.register(_default_archive.close)
+        return _default_archive
+
+
+def default_archive():
+    """进程内共用的页面存档；没有配置时返回 None，不存档"""
+    return _default_archive
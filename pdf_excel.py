@@ -1,74 +1,114 @@
-import pdfplumber
-import pandas as pd
 import re
 from pathlib import Path
 import os
 import logging
 
+from ledger_delta import atomic_save, clear_changes, delta_path, read_ledger, record_changes
+from ledger_index import LedgerIndex, index_path
+from models import LEDGER_COLUMNS, OrderLine, order_lines_to_frame
+from structured_log import counters
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def extract_order_info(pdf_path):
-    """从PDF中提取订单信息"""
+def extract_order_info(pdf_path, scans=None):
+    """从PDF中提取订单信息
+    
+    扫描版PDF（没有文本层）默认立即OCR识别；传入列表 scans 时只把文件路径加入 scans 并返回 None，
+    由调用方之后把所有扫描件一起识别（见 process_pdf_folder）
+    """
+    import pdfplumber
+    
     order_items = []
     
     filename = os.path.basename(pdf_path)
-    print(f"开始处理文件: {filename}")
+    logging.debug("开始处理文件: %s", filename)
     
     with pdfplumber.open(pdf_path) as pdf:
         page = pdf.pages[0]
-        text = page.extract_text()
+        text = page.extract_text() or ""
         
-        # 提取订单号
-        order_match = re.search(r'订单号[:：]\s*(\d+)', text)
-        if not order_match:
-            order_match = re.search(r'订单号.*?(\d{8,})', text)
-        if not order_match:
-            order_match = re.search(r'订单.*?号[：:]\s*(\d+)', text)
-        if not order_match:
-            # 尝试从文本中查找订单号格式的数字
-            order_match = re.search(r'(?<!商品)(27\d{6})', text)
+        # 扫描版PDF没有文本层，改用OCR识别出的文字
+        if not text.strip():
+            if scans is not None:
+                scans.append(pdf_path)
+                return None
+            counters.count("OCR识别文件")
+            logging.info("文件 %s 没有文本层，尝试OCR识别", filename)
+            try:
+                from ocr_fallback import ocr_pdf_text
+                text = ocr_pdf_text(pdf_path)
+            except ImportError as e:
+                logging.warning("%s", e)
+                return order_items
+            return extract_order_info_from_text(text, pdf_path)
         
-        if order_match:
-            order_number = order_match.group(1)
-            print(f"找到订单号: {order_number}")
-        else:
-            print("警告：未找到订单号")
-            file_name = Path(pdf_path).stem
-            # 尝试从文件名中提取订单号
-            if file_name.startswith("CNREC"):
-                order_number = file_name
-            else:
-                order_number = "未知"
+        order_number = extract_order_number(text, pdf_path)
         
         # 使用表格和文本结合的方式提取商品信息
         # 首先从表格中获取商品编号和金额
         items_from_table = extract_basic_items_from_table(page, order_number)
         
         # 然后从文本中确认商品数量并提取商品描述
-        final_items = []
-        for item in items_from_table:
-            product_code = item['商品货号']
-            
-            # 在文本中精确查找这个商品的行
-            qty = extract_accurate_quantity(text, product_code)
-            
-            # 提取商品描述
-            description = extract_product_description(text, product_code)
-            if description:
-                item['商品名称与描述'] = description
-            
-            # 更新商品数量和单价
-            if qty > 0:
-                item['数量'] = qty
-                # 重新计算单价
-                item['商品单价'] = round(item['金额'] / qty, 2)
-            
-            final_items.append(item)
-            print(f"最终商品信息: {product_code}, 数量: {item['数量']}, 单价: {item['商品单价']}, 金额: {item['金额']}, 描述: {item['商品名称与描述']}")
+        return refine_items(items_from_table, text)
+
+def extract_order_info_from_text(text, pdf_path):
+    """从购物凭证的文字（OCR结果或文本层）中提取订单信息，不依赖表格结构"""
+    order_number = extract_order_number(text, pdf_path)
+    return refine_items(extract_basic_items_from_text(text, order_number), text)
+
+def extract_order_number(text, pdf_path):
+    """从文本中提取订单号，找不到时尝试使用文件名"""
+    order_match = re.search(r'订单号[:：]\s*(\d+)', text)
+    if not order_match:
+        order_match = re.search(r'订单号.*?(\d{8,})', text)
+    if not order_match:
+        order_match = re.search(r'订单.*?号[：:]\s*(\d+)', text)
+    if not order_match:
+        # 尝试从文本中查找订单号格式的数字
+        order_match = re.search(r'(?<!商品)(27\d{6})', text)
+    
+    if order_match:
+        order_number = order_match.group(1)
+        logging.debug("找到订单号: %s", order_number)
+    else:
+        counters.count("未找到订单号")
+        logging.warning("未找到订单号: %s", pdf_path)
+        file_name = Path(pdf_path).stem
+        # 尝试从文件名中提取订单号
+        if file_name.startswith("CNREC"):
+            order_number = file_name
+        else:
+            order_number = "未知"
+    return order_number
+
+def refine_items(items, text):
+    """从文本中确认商品数量并提取商品描述"""
+    final_items = []
+    for item in items:
+        product_code = item.product_code
+        
+        # 在文本中精确查找这个商品的行
+        qty = extract_accurate_quantity(text, product_code)
+        
+        # 提取商品描述
+        description = extract_product_description(text, product_code)
+        if description:
+            item.description = description
+        
+        # 更新商品数量和单价
+        if qty > 0:
+            item.quantity = qty
+            # 重新计算单价
+            item.unit_price = round(item.amount / qty, 2)
+        
+        final_items.append(item)
+        counters.count("提取商品行")
+        logging.debug("最终商品信息: %s, 数量: %s, 单价: %s, 金额: %s, 描述: %s",
+                      product_code, item.quantity, item.unit_price, item.amount, item.description)
     
     return final_items
 
@@ -215,21 +255,55 @@ def extract_basic_items_from_table(page, order_number):
                     
                     # 添加商品（暂时使用默认数量1）
                     if product_code and amount > 0:
-                        item = {
-                            '订单号': order_number,
-                            '商品货号': product_code,
-                            '数量': 1,  # 默认值，稍后更新
-                            '商品单价': amount,  # 默认等于金额，稍后更新
-                            '现价': "",
-                            '金额': amount,
-                            '商品名称与描述': description  # 添加从表格中提取的描述
-                        }
+                        item = OrderLine(
+                            order_number=order_number,
+                            product_code=product_code,
+                            quantity=1,  # 默认值，稍后更新
+                            unit_price=amount,  # 默认等于金额，稍后更新
+                            amount=amount,
+                            description=description  # 添加从表格中提取的描述
+                        )
                         items.append(item)
             
             break
     
     return items
 
+def extract_basic_items_from_text(text, order_number):
+    """从文本行中提取基本商品信息（商品编号、金额），用于没有表格结构的OCR文字
+    
+    行格式如: 804.738.68 VÄLVÅRDAD 微勒沃达德 干碗架 13x32 不锈钢 AP 1 29.99 13 % ¥ 29.99
+    组合商品的行没有税率: 092.908.25 BERGSHULT 贝利斯胡特/格兰胡特 墙搁80x20白/镀镍AP 2 99.00 ¥ 198.00
+    """
+    items = []
+    line_pattern = re.compile(
+        r'(\d{3}\.\d{3}\.\d{2})\s+(.*?)\s+(\d+)\s+([\d,]+\.\d{2})\s+(?:\d+\s*%\s*)?(?:-?[\d,]+\.\d{2}\s+)?[¥Y]\s*(-?[\d,]+\.\d{2})'
+    )
+    
+    for line in text.split('\n'):
+        match = line_pattern.search(line)
+        if not match:
+            continue
+        
+        product_code = match.group(1)
+        
+        # 跳过自提/快递商品
+        if product_code.startswith('500.') and product_code != "500.005.97":
+            continue
+        
+        amount = float(match.group(5).replace(',', ''))
+        if amount > 0:
+            items.append(OrderLine(
+                order_number=order_number,
+                product_code=product_code,
+                quantity=1,  # 默认值，稍后更新
+                unit_price=amount,  # 默认等于金额，稍后更新
+                amount=amount,
+                description=match.group(2).strip()
+            ))
+    
+    return items
+
 def extract_accurate_quantity(text, product_code):
     """精确提取商品数量"""
     # 默认数量
@@ -280,18 +354,51 @@ def extract_accurate_quantity(text, product_code):
     
     return quantity
 
-def update_excel(items, excel_path):
-    """更新Excel文件"""
+def append_rows_delta(df_new, excel_path):
+    """把新行作为增量改动追加到订单汇总表之后，不改写Excel；表头缺少列时返回 False"""
+    index = LedgerIndex.load(excel_path)
+    missing = [col for col in LEDGER_COLUMNS if col not in index.columns]
+    if missing:
+        print(f"订单汇总表缺少列 {missing}，改为完整保存")
+        return False
+    
+    df_new = df_new.reindex(columns=LEDGER_COLUMNS)
+    records = df_new.astype(object).where(df_new.notna(), None).to_dict('records')
+    first_row = index.next_row
+    cells = []
+    for offset, record in enumerate(records):
+        cells.extend((first_row + offset, col, value) for col, value in record.items())
+        index.add_row(first_row + offset, record['商品货号'])
+    record_changes(excel_path, cells)
+    index.save(refresh_signature=True)
+    print(f"已把 {len(records)} 行追加到增量文件: {delta_path(excel_path)}")
+    return True
+
+def update_excel(items, excel_path, delta=False):
+    """更新Excel文件
+    
+    delta=True 且订单汇总表已存在时，新行只写入增量文件（见 ledger_delta），之后用 compact 合并
+    """
+    import pandas as pd
+    
     try:
         # 创建新数据的DataFrame
-        df_new = pd.DataFrame(items)
+        df_new = order_lines_to_frame(items)
         
-        # 如果Excel文件存在，读取并合并数据
+        if delta and Path(excel_path).exists() and append_rows_delta(df_new, excel_path):
+            return
+        
+        # 如果Excel文件存在，读取并合并数据（包括增量文件中尚未合并的改动）
+        index = None
         if Path(excel_path).exists():
-            df_existing = pd.read_excel(excel_path)
+            df_existing = read_ledger(excel_path).reset_index(drop=True)
+            
+            # 已有的货号索引仍然有效时，只需把新追加的行加进去
+            if index_path(excel_path).exists():
+                index = LedgerIndex.load(excel_path)
             
             # 确保两个DataFrame具有相同的列
-            columns = ['订单号', '商品货号', '数量', '商品单价', '现价', '金额', '商品名称与描述']
+            columns = LEDGER_COLUMNS
             for col in columns:
                 if col not in df_existing.columns:
                     df_existing[col] = ""
@@ -313,16 +420,27 @@ def update_excel(items, excel_path):
         else:
             df_combined = df_new
         
-        # 保存到Excel
-        df_combined.to_excel(excel_path, index=False)
+        # 先写到临时文件再替换，保存中途出错不会损坏原来的表格；增量改动此时已包含在内
+        atomic_save(lambda path: df_combined.to_excel(path, index=False), excel_path)
+        clear_changes(excel_path)
         print(f"成功保存数据到Excel文件: {excel_path}")
         
+        # 更新货号索引：新数据追加在原有数据之后
+        if (index is not None and list(index.columns) == list(df_combined.columns)
+                and index.max_row == len(df_combined) - len(df_new) + 1):
+            first_row = index.next_row
+            for offset, code in enumerate(df_new['商品货号'].tolist()):
+                index.add_row(first_row + offset, code)
+        else:
+            index = LedgerIndex.from_frame(df_combined, excel_path)
+        index.save(refresh_signature=True)
+        
     except Exception as e:
         print(f"保存Excel文件时出错: {str(e)}")
         raise
 
-def process_pdf_folder(pdf_folder, excel_path):
-    """处理文件夹中的所有PDF文件"""
+def process_pdf_folder(pdf_folder, excel_path, delta=False):
+    """处理文件夹中的所有PDF文件；delta 同 update_excel"""
     # 确保PDF文件夹存在
     pdf_folder_path = Path(pdf_folder)
     if not pdf_folder_path.exists():
@@ -342,25 +460,47 @@ def process_pdf_folder(pdf_folder, excel_path):
     error_count = 0
     all_items = []
     
-    for pdf_file in pdf_files:
+    def parse(name, extract):
+        nonlocal success_count, error_count
         try:
-            print(f"\n开始处理文件: {pdf_file.name}")
-            items = extract_order_info(str(pdf_file))
-            if items:
-                all_items.extend(items)
-                print(f"成功处理文件: {pdf_file.name}，提取 {len(items)} 个商品")
-                success_count += 1
-            else:
-                print(f"警告：从文件 {pdf_file.name} 中未提取到商品信息")
-                error_count += 1
+            items = extract()
         except Exception as e:
-            print(f"处理文件 {pdf_file.name} 时出错: {str(e)}")
+            logging.error("处理文件 %s 时出错: %s", name, e, exc_info=True)
             error_count += 1
-            continue
+            return
+        if items is None:
+            return
+        if items:
+            all_items.extend(items)
+            logging.debug("成功处理文件: %s，提取 %d 个商品", name, len(items))
+            success_count += 1
+        else:
+            logging.warning("从文件 %s 中未提取到商品信息", name)
+            error_count += 1
+    
+    # 解析时发现没有文本层的扫描件先记下来，之后一起提交到OCR进程池并行识别
+    scans = []
+    for pdf_file in pdf_files:
+        parse(pdf_file.name, lambda: extract_order_info(str(pdf_file), scans))
+    
+    if scans:
+        try:
+            from ocr_fallback import ocr_pdfs
+            texts = ocr_pdfs(scans)
+            print(f"已OCR识别 {len(scans)} 个扫描件")
+        except ImportError as e:
+            print(f"警告：{str(e)}，扫描版PDF将被跳过")
+            texts = {}
+            error_count += len(scans)
+        for pdf_path, text in texts.items():
+            if text is None:
+                error_count += 1
+                continue
+            parse(os.path.basename(pdf_path), lambda: extract_order_info_from_text(text, pdf_path))
     
     # 保存所有数据到Excel
     if all_items:
-        update_excel(all_items, excel_path)
+        update_excel(all_items, excel_path, delta)
     
     # 打印处理结果统计
     print("\n处理完成！")
@@ -368,6 +508,7 @@ def process_pdf_folder(pdf_folder, excel_path):
     print(f"处理失败: {error_count} 个文件")
     print(f"总计文件: {len(pdf_files)} 个")
     print(f"总计提取: {len(all_items)} 个商品")
+    counters.log_summary()
 
 def main():
     # 设置路径
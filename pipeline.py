@@ -0,0 +1,297 @@
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+
+from models import product_key
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# 队列结束标记
+_DONE = object()
+
+
+class Pipeline:
+    """从PDF购物凭证到订单汇总表的流水线：解析 → 规划 → 查询 → 比对 → 批量写入
+
+    各阶段之间用有界队列连接，每个阶段在自己的线程中运行：
+    一张凭证解析完，其中的商品立即进入价格查询，不必等整个文件夹处理完；
+    内存占用由队列大小决定，与凭证数量无关。写入使用增量文件（见 ledger_delta），
+    结束时合并一次。
+    """
+
+    def __init__(self, excel_file, rate=0.5, burst=2, parse_workers=2, fetchers=4, queue_size=100,
+                 batch_size=50, flush_interval=30, refresh_ledger=False, calendar=None, client=None):
+        self.excel_file = excel_file
+        self.parse_workers = parse_workers
+        self.fetchers = fetchers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.refresh_ledger = refresh_ledger
+        self.calendar = calendar
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+
+        self.pdf_queue = queue.Queue(maxsize=queue_size)
+        self.lines_queue = queue.Queue(maxsize=queue_size)
+        self.fetch_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+
+        # 规划阶段记录的购买单价，比对阶段用来及时报告降价（写入时还会在整张表上比对一次）
+        self.unit_prices = {}
+        self.unit_prices_lock = threading.Lock()
+        self.stats = {'pdfs': 0, 'failed_pdfs': 0, 'lines': 0, 'planned': 0, 'skipped': 0,
+                      'fetched': 0, 'no_price': 0, 'drops': 0, 'batches': 0, 'repriced': 0, 'unpriced_rows': 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    def run(self, pdf_paths=(), compact=True):
+        """处理 pdf_paths（可以是生成器）中的凭证，返回各阶段的统计数据"""
+        from fetch_client import FetchClient
+
+        owns_client = self.client is None
+        self.client = self.client or FetchClient(rate=self.rate, burst=self.burst, pool_size=self.fetchers)
+        started = time.time()
+
+        threads = [threading.Thread(target=self._feed, args=(pdf_paths,), name="pipeline-feed")]
+        parsers = [threading.Thread(target=self._parse, name=f"pipeline-parse-{i}") for i in range(self.parse_workers)]
+        fetchers = [threading.Thread(target=self._fetch, name=f"pipeline-fetch-{i}") for i in range(self.fetchers)]
+        planner = threading.Thread(target=self._plan, name="pipeline-plan")
+        comparer = threading.Thread(target=self._compare, name="pipeline-compare")
+        writer = threading.Thread(target=self._write, name="pipeline-write")
+        threads += parsers + fetchers + [planner, comparer, writer]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            # 前一阶段的所有线程结束后，再通知下一阶段结束
+            threads[0].join()
+            for _ in parsers:
+                self.pdf_queue.put(_DONE)
+            for thread in parsers:
+                thread.join()
+            self.lines_queue.put(_DONE)
+            planner.join()
+            for _ in fetchers:
+                self.fetch_queue.put(_DONE)
+            for thread in fetchers:
+                thread.join()
+            self.result_queue.put(_DONE)
+            comparer.join()
+            self.write_queue.put(_DONE)
+            writer.join()
+        finally:
+            if owns_client:
+                self.client.close()
+                self.client = None
+
+        if compact:
+            from ledger_delta import compact as compact_ledger
+
+            if Path(self.excel_file).exists():
+                compact_ledger(self.excel_file)
+
+        self.stats['seconds'] = round(time.time() - started, 1)
+        logging.info("流水线完成: %s", self.stats)
+        return self.stats
+
+    def _feed(self, pdf_paths):
+        for pdf_path in pdf_paths:
+            self.pdf_queue.put(pdf_path)
+
+    def _parse(self):
+        """解析阶段：每张凭证提取出的订单行立即交给规划阶段"""
+        from pdf_excel import extract_order_info
+
+        while True:
+            pdf_path = self.pdf_queue.get()
+            if pdf_path is _DONE:
+                return
+            try:
+                items = extract_order_info(str(pdf_path))
+            except Exception as e:
+                logging.error("解析 %s 时出错: %s", pdf_path, e)
+                items = None
+            if items:
+                self._count('pdfs')
+                self.lines_queue.put(items)
+            else:
+                self._count('failed_pdfs')
+                logging.warning("从文件 %s 中未提取到商品信息", pdf_path)
+
+    def _plan(self):
+        """规划阶段：新订单行交给写入阶段追加；每个货号只查询一次"""
+        seen = set()
+
+        def schedule(product_codes):
+            due = product_codes
+            if self.calendar is not None:
+                due, skipped = self.calendar.plan(product_codes)
+                self._count('skipped', len(skipped))
+            for product_code in due:
+                self._count('planned')
+                self.fetch_queue.put(product_code)
+
+        if self.refresh_ledger and Path(self.excel_file).exists():
+            from update_ikea_prices import collect_product_codes
+
+            try:
+                codes = collect_product_codes(self.excel_file)
+                seen.update(product_key(code) for code in codes)
+                schedule(codes)
+            except Exception as e:
+                logging.error("读取订单汇总表中的货号时出错: %s", e)
+
+        while True:
+            items = self.lines_queue.get()
+            if items is _DONE:
+                return
+            self._count('lines', len(items))
+            # 先把订单行放入写入队列，保证写入价格时这些行已经存在
+            self.write_queue.put(('lines', items))
+            new_codes = []
+            for item in items:
+                key = item.key
+                if not key or item.product_code.startswith('500.'):
+                    continue
+                with self.unit_prices_lock:
+                    self.unit_prices[key] = max(self.unit_prices.get(key, 0), item.unit_price or 0)
+                if key not in seen:
+                    seen.add(key)
+                    new_codes.append(item.product_code)
+            schedule(new_codes)
+
+    def _fetch(self):
+        """查询阶段：多个线程共用一个限速客户端"""
+        from update_ikea_prices import get_product_details
+
+        while True:
+            product_code = self.fetch_queue.get()
+            if product_code is _DONE:
+                return
+            self.result_queue.put(get_product_details(product_code, client=self.client))
+
+    def _compare(self):
+        """比对阶段：记录促销日历，及时报告低于购买单价的商品"""
+        while True:
+            details = self.result_queue.get()
+            if details is _DONE:
+                return
+            self._count('fetched')
+            if details.current_price is None:
+                self._count('no_price')
+                continue
+            if self.calendar is not None:
+                self.calendar.record(details)
+            with self.unit_prices_lock:
+                unit_price = self.unit_prices.get(details.key)
+            if unit_price and details.current_price < unit_price:
+                self._count('drops')
+                logging.debug("【价格下降】%s: 单价 %s，现价 %s", details.product_number, unit_price, details.current_price)
+            self.write_queue.put(('price', details))
+
+    def _write(self):
+        """写入阶段：攒够 batch_size 条或超过 flush_interval 秒后写一次增量文件
+
+        每个货号只查询一次，之后的凭证中再出现同一货号时，新追加的行使用已查到的价格。
+        """
+        lines = []
+        prices = {}
+        # 本次运行已查到的价格，以整数货号为键
+        known = {}
+        last_flush = time.monotonic()
+        while True:
+            try:
+                message = self.write_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                message = None
+            if message is _DONE:
+                self._flush(lines, prices)
+                self._verify(known)
+                return
+            if message is not None:
+                kind, payload = message
+                if kind == 'lines':
+                    lines.extend(payload)
+                    for item in payload:
+                        if item.key in known:
+                            prices[item.key] = known[item.key]
+                else:
+                    known[payload.key] = payload
+                    prices[payload.key] = payload
+            if (len(lines) + len(prices) >= self.batch_size
+                    or time.monotonic() - last_flush >= self.flush_interval):
+                self._flush(lines, prices)
+                lines = []
+                prices = {}
+                last_flush = time.monotonic()
+
+    def _unpriced_keys(self, known):
+        """订单汇总表（含增量文件）中已查到价格、但现价仍为空的行的货号"""
+        from ledger_delta import read_ledger
+
+        df = read_ledger(self.excel_file)
+        if df.empty or '现价' not in df.columns:
+            return {}
+        blank = df[df['现价'].isna()]
+        keys = {}
+        for product_code in blank['商品货号']:
+            key = product_key(product_code)
+            if key in known:
+                keys[key] = keys.get(key, 0) + 1
+        return keys
+
+    def _verify(self, known):
+        """结束前检查：已查到价格的货号所在的行都应有现价，缺少的补写一次"""
+        known = {key: details for key, details in known.items() if details.current_price is not None}
+        if not known or not Path(self.excel_file).exists():
+            return
+        try:
+            missing = self._unpriced_keys(known)
+            if missing:
+                logging.warning("有 %d 行已查到价格但没有写入现价，重新写入", sum(missing.values()))
+                self._flush([], {key: known[key] for key in missing})
+                self._count('repriced', sum(missing.values()))
+                missing = self._unpriced_keys(known)
+            if missing:
+                self._count('unpriced_rows', sum(missing.values()))
+                logging.error("仍有 %d 行已查到价格但没有现价: %s", sum(missing.values()),
+                              [known[key].product_number for key in missing])
+        except Exception as e:
+            logging.error("检查订单汇总表中的现价时出错: %s", e)
+
+    def _flush(self, lines, prices):
+        from ledger_index import LedgerIndex
+        from pdf_excel import update_excel
+        from update_ikea_prices import apply_product_details
+
+        if not lines and not prices:
+            return
+        try:
+            if lines:
+                update_excel(lines, self.excel_file, delta=True)
+            if prices:
+                apply_product_details(self.excel_file, prices, LedgerIndex.load(self.excel_file), delta=True)
+            self._count('batches')
+        except Exception as e:
+            logging.error("写入订单汇总表时出错: %s", e)
+
+
+def run_pipeline(pdf_folder, excel_file, **kwargs):
+    """处理文件夹中的所有PDF购物凭证并查询价格，参数同 Pipeline"""
+    pdf_folder = Path(pdf_folder)
+    if not pdf_folder.exists():
+        logging.error("PDF文件夹不存在: %s", pdf_folder)
+        return None
+    return Pipeline(excel_file, **kwargs).run(pdf_folder.glob("*.pdf"))
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from models import product_key
+
+# 缓存条目的状态
+FRESH = 'fresh'  # 未过软过期时间，直接使用
+STALE = 'stale'  # 过了软过期、未过硬过期，可以先返回再在后台刷新
+EXPIRED = 'expired'  # 过了硬过期，必须重新查询
+
+
+class PriceCache:
+    """内存中的价格缓存，以整数货号为键
+
+    每条结果有软过期（soft_ttl 秒）和硬过期（hard_ttl 秒）两个时间：
+    软过期前为新鲜数据；软过期到硬过期之间为陈旧数据，可以先返回再刷新；
+    硬过期后不再使用。
+    """
+
+    def __init__(self, soft_ttl=3600, hard_ttl=86400):
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = max(hard_ttl, soft_ttl)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def lookup(self, product_number):
+        """返回 (ProductPrice, 状态, 查询时间)，没有缓存时返回 (None, EXPIRED, None)"""
+        key = product_key(product_number)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, EXPIRED, None
+
+            details, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.soft_ttl:
+                self.hits += 1
+                return details, FRESH, fetched_at
+            if age < self.hard_ttl:
+                self.stale_hits += 1
+                return details, STALE, fetched_at
+
+            del self.entries[key]
+            self.misses += 1
+            return None, EXPIRED, None
+
+    def get(self, product_number):
+        """返回新鲜的 ProductPrice，没有或已软过期时返回 None"""
+        details, state, _ = self.lookup(product_number)
+        return details if state == FRESH else None
+
+    def put(self, details):
+        """保存一次查询结果；没有查到价格的结果不缓存，下次会重新查询"""
+        if details.current_price is None:
+            return
+        with self.lock:
+            self.entries[details.key] = (details, time.time())
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from models import product_code_text, product_key
+
+
+class PriceTable:
+    """按列存储的价格表，以整数货号排序，用二分查找做批量关联"""
+
+    __slots__ = ('keys', 'original_prices', 'current_prices', 'on_sale')
+
+    def __init__(self, keys, original_prices, current_prices, on_sale):
+        order = np.argsort(keys, kind='stable')
+        self.keys = np.asarray(keys, dtype=np.int64)[order]
+        self.original_prices = np.asarray(original_prices, dtype=np.float64)[order]
+        self.current_prices = np.asarray(current_prices, dtype=np.float64)[order]
+        self.on_sale = np.asarray(on_sale, dtype=bool)[order]
+
+    @classmethod
+    def from_details(cls, details):
+        """由 ProductPrice 列表构建，没有查到现价的商品不计入"""
+        rows = [d for d in details if d is not None and d.current_price and d.key is not None]
+        return cls(
+            [d.key for d in rows],
+            [np.nan if d.original_price is None else d.original_price for d in rows],
+            [d.current_price for d in rows],
+            [d.is_on_sale for d in rows],
+        )
+
+    @classmethod
+    def from_mapping(cls, prices):
+        """由 {货号: 现价} 字典构建，货号可以是整数键或任意格式的字符串"""
+        items = [(product_key(k) if not isinstance(k, (int, np.integer)) else int(k), v)
+                 for k, v in prices.items() if v]
+        return cls(
+            [k for k, _ in items],
+            [np.nan] * len(items),
+            [v for _, v in items],
+            [False] * len(items),
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """批量查询现价，keys 为整数货号数组，找不到的返回 NaN"""
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(self.keys) == 0:
+            return np.full(len(keys), np.nan)
+        pos = np.searchsorted(self.keys, keys)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        found = self.keys[pos] == keys
+        return np.where(found, self.current_prices[pos], np.nan)
+
+
+def normalize_product_codes(codes):
+    """批量把商品货号转换为整数键（与 models.product_key 的结果一致）
+
+    返回 (labels, keys)：keys 为去重后的整数货号（无法识别的为 -1），labels 为每一行
+    对应 keys 中的位置，空值为 -1。订单表中同一货号会重复出现，字符串处理只对去重后的货号做一次。
+    """
+    labels, uniques = pd.factorize(codes)
+    digits = pd.Index(uniques).map(product_code_text).astype(str).str.replace(r'\D', '', regex=True)
+    keys = pd.to_numeric(digits.where(digits != ''), errors='coerce')
+    keys = np.asarray(keys, dtype=np.float64)
+    return labels, np.where(np.isnan(keys), -1, keys).astype(np.int64)
+
+
+def compare_prices(df, new_prices=None):
+    """对整个订单表做一次向量化的价格比对
+
+    df 至少包含 商品货号、数量、商品单价、现价 列；
+    new_prices 为 PriceTable，或 {货号: 最新现价} 字典。不传时直接用表中已有的现价比对，
+    这样修改比对规则后不需要重新查询价格。
+
+    返回在 df 基础上增加以下列的新表:
+        新现价、降价金额、降价比例、可退差额、价格变化、低于单价、需要标记
+    """
+    result = df.copy()
+    labels, keys = normalize_product_codes(result['商品货号'])
+    has_code = labels >= 0
+    # 跳过空行和自提/物流货号（500.开头）
+    key_valid = (keys > 0) & (keys // 100000 != 500)
+    valid = pd.Series(has_code & np.append(key_valid, False)[labels], index=result.index)
+
+    unit_price = pd.to_numeric(result['商品单价'], errors='coerce')
+    quantity = pd.to_numeric(result['数量'], errors='coerce').fillna(1)
+    old_price = pd.to_numeric(result['现价'], errors='coerce')
+
+    if new_prices is None:
+        new_price = old_price.copy()
+        changed = pd.Series(False, index=result.index)
+    else:
+        if not isinstance(new_prices, PriceTable):
+            new_prices = PriceTable.from_mapping(new_prices)
+        key_price = new_prices.lookup(keys)
+        new_price = pd.Series(np.append(key_price, np.nan)[labels], index=result.index)
+        # 只有原来有现价、且和新现价不同时才算价格变化
+        changed = old_price.notna() & (old_price != 0) & new_price.notna() & (new_price != 0) & (old_price != new_price)
+
+    # 现价为空或0表示没有查到价格
+    new_price = new_price.where(valid & (new_price != 0))
+
+    drop = unit_price - new_price
+    lower = (drop > 0).fillna(False)
+
+    result['新现价'] = new_price
+    result['降价金额'] = drop.where(lower, 0.0).round(2)
+    result['降价比例'] = (drop / unit_price).where(lower, 0.0).replace([np.inf, -np.inf], 0.0).round(4)
+    result['可退差额'] = (result['降价金额'] * quantity).round(2)
+    result['价格变化'] = (changed & valid).astype(bool)
+    result['低于单价'] = (lower & valid).astype(bool)
+    result['需要标记'] = result['价格变化'] | result['低于单价']
+    return result
+
+
+def summarize_price_drops(compared):
+    """按商品货号汇总降价情况，按可退差额从大到小排序"""
+    drops = compared[compared['低于单价']].assign(
+        数量=lambda d: pd.to_numeric(d['数量'], errors='coerce'),
+        商品单价=lambda d: pd.to_numeric(d['商品单价'], errors='coerce'),
+    )
+    if drops.empty:
+        return pd.DataFrame(columns=['商品货号', '行数', '数量', '商品单价', '新现价', '降价金额', '可退差额'])
+
+    summary = drops.groupby('商品货号', sort=False).agg(
+        行数=('商品货号', 'size'),
+        数量=('数量', 'sum'),
+        商品单价=('商品单价', 'max'),
+        新现价=('新现价', 'min'),
+        降价金额=('降价金额', 'max'),
+        可退差额=('可退差额', 'sum'),
+    ).reset_index()
+    return summary.sort_values('可退差额', ascending=False, ignore_index=True)
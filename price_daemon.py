@@ -0,0 +1,136 @@
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from price_service import PriceService
+
+# 一次请求最多查询或刷新的货号数
+MAX_CODES = 100
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+class PriceRequestHandler(BaseHTTPRequestHandler):
+    """本地HTTP/JSON接口
+
+    GET  /price?code=705.316.56&code=102.635.24   查询一个或多个商品（陈旧缓存带 "stale": true）
+    POST /price  {"codes": ["705.316.56", ...]}    同上
+    POST /refresh                                  后台刷新订单汇总表
+    POST /refresh {"codes": ["705.316.56", ...]}   只刷新这些货号所在的行
+    GET  /refresh                                  刷新状态
+    GET  /drops                                    降价商品（启动时按表中已有现价比对，每次刷新后更新）
+    GET  /stats                                    缓存与请求统计
+    """
+
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/price':
+            try:
+                codes = validate_codes(parse_qs(url.query).get('code', []))
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._lookup(codes)
+        elif url.path == '/refresh':
+            self._send_json(200, self.service.refresh_status)
+        elif url.path == '/drops':
+            self._send_json(200, {"drops": self.service.recent_drops, "refresh": self.service.refresh_status})
+        elif url.path == '/stats':
+            self._send_json(200, self.service.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == '/price':
+            try:
+                codes = validate_codes(self._read_body().get('codes', []))
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._lookup(codes)
+        elif url.path == '/refresh':
+            try:
+                body = self._read_body()
+                codes = validate_codes(body['codes']) if body.get('codes') is not None else None
+                started = self.service.start_refresh(codes or None)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_json(202 if started else 409, self.service.refresh_status)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _lookup(self, codes):
+        if not codes:
+            self._send_json(400, {"error": "missing product codes"})
+            return
+        self._send_json(200, {"results": self.service.query_many(codes)})
+
+    def _read_body(self):
+        """读取JSON请求体；请求体必须是JSON对象，否则抛出 ValueError"""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise ValueError("invalid Content-Length")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            raise ValueError("invalid json")
+        if not isinstance(body, dict):
+            raise ValueError("request body must be a JSON object")
+        return body
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+def validate_codes(codes):
+    """检查货号列表：必须是字符串列表、每个货号为8位数字（可以带点），最多 MAX_CODES 个"""
+    if not isinstance(codes, list):
+        raise ValueError('"codes" must be a list of product codes')
+    if len(codes) > MAX_CODES:
+        raise ValueError(f"too many product codes (max {MAX_CODES})")
+    for code in codes:
+        if not isinstance(code, str):
+            raise ValueError('"codes" must be a list of strings')
+        if len(''.join(filter(str.isdigit, code))) != 8:
+            raise ValueError(f"invalid product code: {code}")
+    return codes
+
+
+def create_server(service, host='127.0.0.1', port=8765):
+    """创建HTTP服务（不启动），方便在其他程序或测试中使用"""
+    handler = type('BoundPriceRequestHandler', (PriceRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(excel_file=None, host='127.0.0.1', port=8765, rate=0.5, delta=False):
+    """启动常驻价格服务，直到按 Ctrl+C 退出"""
+    service = PriceService(excel_file=excel_file, rate=rate, delta=delta)
+    server = create_server(service, host, port)
+    logging.info(f"价格服务已启动: http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
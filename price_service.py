@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fetch_client import FetchClient
+from price_cache import EXPIRED, STALE, PriceCache
+from single_flight import SingleFlight
+from validator_store import ValidatorStore
+from update_ikea_prices import clean_product_number, get_product_details, update_excel_prices, update_products
+
+
+class PriceService:
+    """常驻的价格查询服务：共用HTTP连接池、价格缓存和订单汇总表状态"""
+
+    def __init__(self, excel_file=None, rate=0.5, burst=2, soft_ttl=3600, hard_ttl=86400, validator_db=None,
+                 delta=False):
+        self.excel_file = excel_file
+        # 为 True 时全表刷新的结果也只写入增量文件，不改写整个Excel（指定货号的刷新总是只写增量文件）
+        self.delta = delta
+        self.client = FetchClient(rate=rate, burst=burst, validators=ValidatorStore(validator_db))
+        self.cache = PriceCache(soft_ttl=soft_ttl, hard_ttl=hard_ttl)
+        self.flight = SingleFlight()
+        # 后台刷新也走同一个限速客户端，线程数不必多
+        self.revalidate_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="revalidate")
+        self.revalidating = set()
+        self.revalidate_lock = threading.Lock()
+        # 多个请求同时触发刷新时，只有一个能启动刷新线程
+        self.refresh_lock = threading.Lock()
+        self.refresh_thread = None
+        self.refresh_status = {"running": False, "started_at": None, "finished_at": None, "success": None}
+        # 启动时先按表中已有的现价比对一次，第一次刷新完成前 /drops 也有结果
+        self.recent_drops = self._initial_drops()
+
+    def lookup(self, product_number):
+        """查询一个商品的价格，只使用新鲜缓存，否则等待网络查询；同一货号同时只会有一次网络请求"""
+        cached = self.cache.get(product_number)
+        if cached is not None:
+            return cached
+        return self.flight.do(clean_product_number(product_number), self._fetch, product_number)
+
+    def query(self, product_number):
+        """面向交互查询：陈旧缓存立即返回并在后台刷新，过了硬过期才等待网络查询
+
+        返回 ProductPrice 的字段，外加 stale（是否为陈旧数据）和 fetched_at（查询时间）
+        """
+        details, state, fetched_at = self.cache.lookup(product_number)
+        if state == STALE:
+            self._schedule_revalidate(product_number)
+        elif state == EXPIRED:
+            details = self.flight.do(clean_product_number(product_number), self._fetch, product_number)
+            fetched_at = time.time() if details.current_price is not None else None
+
+        result = details.to_dict()
+        result["stale"] = state == STALE
+        result["fetched_at"] = fetched_at
+        return result
+
+    def query_many(self, product_numbers):
+        """并发查询多个商品，返回与输入顺序一致的结果列表"""
+        if len(product_numbers) <= 1:
+            return [self.query(p) for p in product_numbers]
+        with ThreadPoolExecutor(max_workers=min(8, len(product_numbers))) as executor:
+            return list(executor.map(self.query, product_numbers))
+
+    def _schedule_revalidate(self, product_number):
+        """在后台刷新一个陈旧的缓存条目，同一货号只排队一次"""
+        key = clean_product_number(product_number)
+        with self.revalidate_lock:
+            if key in self.revalidating:
+                return
+            self.revalidating.add(key)
+
+        def revalidate():
+            try:
+                self.flight.do(key, self._fetch, product_number)
+            except Exception as e:
+                logging.warning("后台刷新商品 %s 失败: %s", product_number, e)
+            finally:
+                with self.revalidate_lock:
+                    self.revalidating.discard(key)
+
+        self.revalidate_executor.submit(revalidate)
+
+    def _fetch(self, product_number):
+        details = get_product_details(product_number, client=self.client)
+        self.cache.put(details)
+        return details
+
+    def start_refresh(self, product_numbers=None):
+        """在后台刷新订单汇总表中的现价；已在刷新时返回 False
+
+        指定 product_numbers 时只刷新这些货号所在的行（通过货号索引定位，不扫描整张表）
+        """
+        if not self.excel_file:
+            raise ValueError("没有配置订单汇总Excel文件")
+        with self.refresh_lock:
+            if self.refresh_thread and self.refresh_thread.is_alive():
+                return False
+            self.refresh_status = {"running": True, "started_at": time.time(), "finished_at": None,
+                                   "success": None}
+            self.refresh_thread = threading.Thread(target=self._refresh, args=(product_numbers,),
+                                                   name="ledger-refresh", daemon=True)
+            self.refresh_thread.start()
+        return True
+
+    def _refresh(self, product_numbers=None):
+        success = False
+        try:
+            if product_numbers:
+                success = update_products(self.excel_file, product_numbers, fetch_details=self.lookup)
+            else:
+                success = update_excel_prices(self.excel_file, fetch_details=self.lookup, delta=self.delta)
+            if success:
+                self.recent_drops = self._load_drops()
+        except Exception as e:
+            logging.error(f"刷新订单汇总表时出错: {str(e)}")
+        finally:
+            self.refresh_status.update(running=False, finished_at=time.time(), success=success)
+
+    def _initial_drops(self):
+        if not self.excel_file or not os.path.exists(self.excel_file):
+            return []
+        try:
+            return self._load_drops()
+        except Exception as e:
+            logging.warning(f"读取订单汇总表中的降价商品时出错: {str(e)}")
+            return []
+
+    def _load_drops(self):
+        """按表中已写入的现价重新比对，取得降价商品汇总"""
+        from ledger_delta import read_ledger
+        from price_compare import compare_prices, summarize_price_drops
+
+        summary = summarize_price_drops(compare_prices(read_ledger(self.excel_file)))
+        return summary.to_dict(orient='records')
+
+    def stats(self):
+        flight = self.flight.metrics()
+        return {
+            "cached": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_stale_hits": self.cache.stale_hits,
+            "revalidating": len(self.revalidating),
+            "cache_misses": self.cache.misses,
+            "requests": self.client.request_count,
+            "not_modified": self.client.validators.not_modified,
+            "unchanged": self.client.validators.unchanged,
+            "lookups_issued": flight["issued"],
+            "lookups_coalesced": flight["coalesced"],
+            "inflight": flight["inflight"],
+        }
+
+    def close(self):
+        self.revalidate_executor.shutdown(wait=False, cancel_futures=True)
+        self.client.close()
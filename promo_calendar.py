@@ -0,0 +1,131 @@
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from models import product_key
+
+# 没有优惠有效期的商品，至少间隔多久再查一次（小时）
+DEFAULT_RECHECK_HOURS = 24
+
+
+class PromoCalendar:
+    """促销日历：记录每个商品上次查询的时间、价格和优惠有效期
+
+    db_path 为 None 时只保存在内存中；指定路径时保存到SQLite，下次运行可以继续使用。
+    """
+
+    def __init__(self, db_path=None, recheck_hours=DEFAULT_RECHECK_HOURS):
+        self.recheck_hours = recheck_hours
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path or ':memory:', check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS promos (
+                key INTEGER PRIMARY KEY,
+                product_number TEXT,
+                current_price REAL,
+                is_on_sale INTEGER,
+                promo_start TEXT,
+                promo_end TEXT,
+                checked_at REAL
+            )
+        ''')
+        self.conn.commit()
+
+    def record(self, details, checked_at=None):
+        """记录一次查询结果；没有查到价格时不记录，下次照常查询"""
+        if details.current_price is None or details.key is None:
+            return
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO promos
+                    (key, product_number, current_price, is_on_sale, promo_start, promo_end, checked_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (details.key, details.product_number, details.current_price, int(details.is_on_sale),
+                  details.promo_start, details.promo_end, checked_at or time.time()))
+            self.conn.commit()
+
+    def entry(self, product_number):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT product_number, current_price, is_on_sale, promo_start, promo_end, checked_at '
+                'FROM promos WHERE key = ?', (product_key(product_number),)
+            ).fetchone()
+        if not row:
+            return None
+        keys = ('product_number', 'current_price', 'is_on_sale', 'promo_start', 'promo_end', 'checked_at')
+        return dict(zip(keys, row))
+
+    def next_check(self, product_number):
+        """下次需要查询的时间（datetime）；没有记录时返回 None，表示马上查询
+
+        - 促销中且知道结束日期: 价格在结束前不会变，结束后的第一天再查
+        - 其他商品: 距上次查询 recheck_hours 小时后再查，以便发现新的降价
+        """
+        entry = self.entry(product_number)
+        if entry is None:
+            return None
+        checked_at = datetime.fromtimestamp(entry['checked_at'])
+        if entry['is_on_sale'] and entry['promo_end']:
+            promo_end = date.fromisoformat(entry['promo_end'])
+            # 查询时促销已经结束，说明页面还没更新，按普通间隔复查
+            if checked_at.date() <= promo_end:
+                return datetime.combine(promo_end + timedelta(days=1), datetime.min.time())
+        return checked_at + timedelta(hours=self.recheck_hours)
+
+    def plan(self, product_numbers, now=None):
+        """把货号分为现在需要查询的和可以跳过的，返回 (due, skipped)
+
+        skipped 为 [(货号, 下次查询时间), ...]
+        """
+        now = now or datetime.now()
+        due = []
+        skipped = []
+        for product_number in product_numbers:
+            next_check = self.next_check(product_number)
+            if next_check is None or next_check <= now:
+                due.append(product_number)
+            else:
+                skipped.append((product_number, next_check))
+        return due, skipped
+
+    def upcoming(self, days=7, today=None):
+        """今后 days 天内结束的促销，按结束日期排序: [(货号, 结束日期), ...]"""
+        today = today or date.today()
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT product_number, promo_end FROM promos '
+                'WHERE is_on_sale = 1 AND promo_end >= ? AND promo_end <= ? ORDER BY promo_end',
+                (today.isoformat(), (today + timedelta(days=days)).isoformat())
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def run_scheduler(excel_file, calendar, poll_interval=3600, fetch_details=None, stop_event=None):
+    """按促销日历定期查询订单汇总表中到期的商品，只更新这些商品所在的行
+
+    每轮只查询 calendar.plan 认为需要查询的货号（促销刚结束的、超过复查间隔的、从未查过的），
+    价格还锁定在优惠期内的商品跳过。改动只追加到增量文件（见 update_products），每轮不改写整个Excel。
+    stop_event（threading.Event）被设置后退出。
+    """
+    from update_ikea_prices import collect_product_codes, get_product_details, update_products
+
+    fetch = fetch_details or get_product_details
+    stop_event = stop_event or threading.Event()
+
+    def fetch_and_record(product_number):
+        details = fetch(product_number)
+        calendar.record(details)
+        return details
+
+    while not stop_event.is_set():
+        due, skipped = calendar.plan(collect_product_codes(excel_file))
+        logging.info(f"本轮需要查询 {len(due)} 个商品，{len(skipped)} 个商品价格锁定在优惠期内或刚查过，跳过")
+        if due:
+            update_products(excel_file, due, fetch_details=fetch_and_record)
+        stop_event.wait(poll_interval)
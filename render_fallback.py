@@ -0,0 +1,147 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+# 价格区块出现后即可取页面内容（新版商品页为 i-product-price，旧版为 pip-price）
+PRICE_SELECTOR = '.i-product-price, .pip-price, .pip-price-package, [data-product-price]'
+# 渲染价格用不到的资源，全部拦截以减少流量和渲染时间
+BLOCKED_RESOURCE_TYPES = ('image', 'font', 'stylesheet', 'media')
+
+
+class RenderPool:
+    """无头浏览器渲染池：价格区块由 JavaScript 渲染、直接解析HTML找不到价格时使用
+
+    浏览器和 size 个浏览器上下文在后台线程的事件循环中保持启动状态（预热），
+    render() 可以从任意线程调用，最多 size 个页面同时渲染，其余调用排队等待。
+    每个上下文渲染 max_pages_per_context 个页面后重建，避免长时间运行时内存增长。
+    需要安装 playwright: pip install playwright && playwright install chromium；
+    executable_path 为使用已安装的 Chrome/Chromium 时的可执行文件路径。
+    """
+
+    def __init__(self, size=2, timeout=15, user_agent=None, locale='zh-CN',
+                 blocked_resource_types=BLOCKED_RESOURCE_TYPES, max_pages_per_context=50, executable_path=None):
+        try:
+            from playwright.async_api import async_playwright
+        except ImportError:
+            raise ImportError("渲染页面需要安装 playwright: pip install playwright && playwright install chromium")
+
+        self.size = size
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.locale = locale
+        self.blocked_resource_types = set(blocked_resource_types)
+        self.max_pages_per_context = max_pages_per_context
+        self.executable_path = executable_path
+        self.stats = {'rendered': 0, 'failed': 0, 'blocked_requests': 0}
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="render-pool", daemon=True)
+        self.thread.start()
+        self.closed = False
+        try:
+            self._call(self._start(async_playwright), timeout=60)
+        except Exception:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            raise
+
+    def _call(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    async def _start(self, async_playwright):
+        self.playwright = await async_playwright().start()
+        try:
+            self.browser = await self.playwright.chromium.launch(headless=True, executable_path=self.executable_path)
+        except Exception:
+            await self.playwright.stop()
+            raise
+        self.contexts = asyncio.Queue()
+        for _ in range(self.size):
+            self.contexts.put_nowait((await self._new_context(), 0))
+        logging.info(f"无头浏览器已启动，{self.size} 个渲染上下文")
+
+    async def _new_context(self):
+        context = await self.browser.new_context(user_agent=self.user_agent, locale=self.locale,
+                                                 java_script_enabled=True)
+        await context.route('**/*', self._route)
+        return context
+
+    async def _route(self, route):
+        if route.request.resource_type in self.blocked_resource_types:
+            self.stats['blocked_requests'] += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _render(self, url, wait_selector):
+        # 上下文队列同时起到并发上限的作用：没有空闲的上下文时在这里等待
+        context, used = await self.contexts.get()
+        page = None
+        try:
+            page = await context.new_page()
+            await page.goto(url, wait_until='domcontentloaded', timeout=self.timeout * 1000)
+            try:
+                await page.wait_for_selector(wait_selector, timeout=self.timeout * 1000)
+            except Exception:
+                logging.warning("渲染 %s 时 %s 秒内没有出现价格区块", url, self.timeout)
+            html_text = await page.content()
+            self.stats['rendered'] += 1
+            return html_text
+        finally:
+            if page is not None:
+                await page.close()
+            used += 1
+            if used >= self.max_pages_per_context:
+                await context.close()
+                context, used = await self._new_context(), 0
+            self.contexts.put_nowait((context, used))
+
+    def render(self, url, wait_selector=PRICE_SELECTOR):
+        """渲染页面并返回执行 JavaScript 之后的HTML；失败时返回 None"""
+        if self.closed:
+            return None
+        try:
+            return self._call(self._render(url, wait_selector), timeout=self.timeout * 3)
+        except Exception as e:
+            self.stats['failed'] += 1
+            logging.error("渲染页面 %s 时出错: %s", url, e)
+            return None
+
+    async def _stop(self):
+        while not self.contexts.empty():
+            context, _ = self.contexts.get_nowait()
+            await context.close()
+        await self.browser.close()
+        await self.playwright.stop()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._call(self._stop(), timeout=30)
+        except Exception as e:
+            logging.warning(f"关闭无头浏览器时出错: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        logging.info(f"无头浏览器已关闭: {self.stats}")
+
+
+_default_renderer = None
+_default_renderer_lock = threading.Lock()
+
+
+def configure_renderer(**kwargs):
+    """启动进程内共用的渲染池（参数同 RenderPool），进程退出时自动关闭"""
+    global _default_renderer
+    with _default_renderer_lock:
+        if _default_renderer is not None:
+            _default_renderer.close()
+        _default_renderer = RenderPool(**kwargs)
+        atexit.register(_default_renderer.close)
+        return _default_renderer
+
+
+def default_renderer():
+    """进程内共用的渲染池；没有配置时返回 None，不使用渲染"""
+    return _default_renderer
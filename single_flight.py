@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """合并同一个键上的并发调用
+
+    同一时刻对同一个键的多次调用只会真正执行一次：第一个调用者负责执行，
+    其他调用者等待同一个 Future，拿到相同的结果（或相同的异常）。
+    调用结束后不保留结果，之后的调用会重新执行。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.issued = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """以 key 合并调用 fn(*args, **kwargs)，返回其结果"""
+        with self.lock:
+            future = self.calls.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.calls[key] = future
+                self.issued += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+        return future.result()
+
+    def inflight(self):
+        with self.lock:
+            return len(self.calls)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "issued": self.issued,
+                "coalesced": self.coalesced,
+                "inflight": len(self.calls),
+            }
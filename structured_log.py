@@ -0,0 +1,129 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import Counter
+
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# LogRecord 自带的属性，其余的属性是调用方通过 extra= 传入的结构化字段
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，包括 extra= 传入的字段，例如
+    logging.warning("URL %s 访问失败", url, extra={'product': '705.316.56'})
+    """
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """只把日志记录放入队列，格式化和输出都在后台线程中进行
+
+    标准的 QueueHandler 会在调用线程中先格式化消息（为了跨进程传递），
+    这里的队列在同一进程内，不需要提前格式化。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RunCounters:
+    """本次运行的计数器：逐个商品、逐行重复出现的消息只计数，结束时汇总输出一行"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def sample(self, name, every=100):
+        """计数，并在第1次及之后每 every 次时返回 True，用于抽样输出日志"""
+        with self.lock:
+            self.counts[name] += 1
+            return self.counts[name] % every == 1 or every == 1
+
+    def summary(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def log_summary(self, title="本次运行统计", reset=True):
+        """输出一行汇总；没有计数时不输出"""
+        with self.lock:
+            counts = dict(self.counts)
+            if reset:
+                self.counts.clear()
+        if counts:
+            logging.info("%s: %s", title, ", ".join(f"{name} {value}" for name, value in counts.items()))
+        return counts
+
+
+counters = RunCounters()
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def setup_logging(level=logging.INFO, json_format=False, log_file=None, fmt=DEFAULT_FORMAT):
+    """把根日志改为经由队列输出：调用线程只放入队列，格式化和写控制台/文件在后台线程中进行
+
+    json_format=True 时每条日志输出为一行JSON；log_file 不为空时同时写入该文件。
+    可以重复调用，后一次的设置替换前一次；进程退出时写完队列中剩余的日志。
+    """
+    global _listener
+    formatter = JsonFormatter() if json_format else logging.Formatter(fmt)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+        else:
+            atexit.register(shutdown_logging)
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    return _listener
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并停止后台线程；之后的日志直接在调用线程中输出，不会丢失"""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            if isinstance(handler, _DeferredQueueHandler):
+                root.removeHandler(handler)
+        for handler in _listener.handlers:
+            root.addHandler(handler)
+        _listener = None
@@ -1,5 +1,4 @@
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 import time
 from openpyxl import load_workbook
@@ -7,6 +6,16 @@ from openpyxl.styles import PatternFill
 import random
 import logging
 import re  # 将re模块移到全局导入
+import sys
+from pathlib import Path
+
+# 站点配置在上一级目录的 markets.py 中
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fetch_client import default_client
+from markets import get_market
+
+# 查询的宜家站点，默认中国站
+MARKET = get_market('cn')
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -23,16 +32,16 @@ USER_AGENTS = [
 def get_product_url(product_number):
     """通过搜索获取商品的正确URL"""
     try:
-        search_url = f"https://www.ikea.cn/cn/zh/search/products/?q={product_number}&qtype=search_keywords"
+        search_url = MARKET.search_url(product_number)
         
         headers = {
             'User-Agent': random.choice(USER_AGENTS),
             'Accept': 'text/html,application/xhtml+xml,application/xml',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Referer': 'https://www.ikea.cn/'
+            'Accept-Language': MARKET.accept_language,
+            'Referer': f"https://{MARKET.host}/"
         }
         
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = default_client().get(search_url, headers=headers, timeout=10, key=product_number)
         response.raise_for_status()
         
         return search_url
@@ -45,15 +54,15 @@ def get_product_url(product_number):
 
     """从宜家网站获取商品价格"""
     try:
-        url = f"https://www.ikea.cn/cn/zh/p/mygglasvinge-mu-ge-si-wen-bei-tao-he-2-ge-zhen-tao-duo-se-{product_number}/"
+        url = f"{MARKET.base_url}p/mygglasvinge-mu-ge-si-wen-bei-tao-he-2-ge-zhen-tao-duo-se-{product_number}/"
         
         headers = {
             'User-Agent': random.choice(USER_AGENTS),
             'Accept': 'text/html,application/xhtml+xml,application/xml',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+            'Accept-Language': MARKET.accept_language
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = default_client().get(url, headers=headers, timeout=10, key=product_number)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -124,15 +133,15 @@ def get_product_url(product_number):
 def get_ikea_price(product_number):
     """从宜家网站获取商品价格"""
     try:
-        url = f"https://www.ikea.cn/cn/zh/p/mygglasvinge-mu-ge-si-wen-bei-tao-he-2-ge-zhen-tao-duo-se-{product_number}/"
+        url = f"{MARKET.base_url}p/mygglasvinge-mu-ge-si-wen-bei-tao-he-2-ge-zhen-tao-duo-se-{product_number}/"
         
         headers = {
             'User-Agent': random.choice(USER_AGENTS),
             'Accept': 'text/html,application/xhtml+xml,application/xml',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+            'Accept-Language': MARKET.accept_language
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = default_client().get(url, headers=headers, timeout=10, key=product_number)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -176,7 +185,7 @@ def get_ikea_price(product_number):
 def test_single_product(product_number):
     """测试单个商品的价格获取"""
     logging.info(f"测试商品 {product_number} 的价格获取")
-    url = f"https://www.ikea.cn/cn/zh/p/mygglasvinge-mu-ge-si-wen-bei-tao-he-2-ge-zhen-tao-duo-se-{product_number}/"
+    url = f"{MARKET.base_url}p/mygglasvinge-mu-ge-si-wen-bei-tao-he-2-ge-zhen-tao-duo-se-{product_number}/"
     logging.info(f"访问URL: {url}")
     
     # 添加请求测试
@@ -184,9 +193,9 @@ def test_single_product(product_number):
         headers = {
             'User-Agent': random.choice(USER_AGENTS),
             'Accept': 'text/html,application/xhtml+xml,application/xml',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+            'Accept-Language': MARKET.accept_language
         }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = default_client().get(url, headers=headers, timeout=10, key=product_number)
         logging.info(f"HTTP状态码: {response.status_code}")
         logging.info(f"响应头: {dict(response.headers)}")
     except Exception as e:
@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# 被测试的模块在上一级目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog_snapshot import CatalogSnapshot, build_snapshot, parse_listing_page
+from mock_ikea import (CATEGORIES, CATEGORY_SIZE, LISTING_PAGE_SIZE, MockIkeaServer, category_products,
+                       expected_price, render_listing_page)
+from models import LEDGER_COLUMNS, format_product_code, product_key
+from promo_calendar import PromoCalendar
+from update_ikea_prices import update_excel_prices
+
+
+@pytest.fixture
+def server():
+    server = MockIkeaServer(page_size=1000)
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_parse_listing_page():
+    category = CATEGORIES[0]
+    parsed = parse_listing_page(render_listing_page(category, page=1))
+
+    expected_codes = category_products(category)[:LISTING_PAGE_SIZE]
+    assert [product_key(d.product_number) for d in parsed] == [int(code) for code in expected_codes]
+    for details in parsed:
+        original, current, on_sale = expected_price(details.product_number)
+        assert details.product_number == format_product_code(details.key)
+        assert (details.original_price, details.current_price, details.is_on_sale) == (original, current, on_sale)
+        assert (details.promo_end is not None) == on_sale
+        assert details.url.endswith(f"-{details.key:08d}/")
+
+
+def test_parse_listing_page_past_last_page():
+    assert parse_listing_page(render_listing_page(CATEGORIES[0], page=99)) == []
+
+
+def test_build_snapshot_from_mock_site(server):
+    snapshot = CatalogSnapshot()
+    market = server.market()
+    count = build_snapshot(snapshot, market=market, rate=None)
+
+    codes = [code for category in CATEGORIES for code in category_products(category)]
+    assert count == len(set(codes)) == snapshot.count()
+    found = snapshot.get_many(codes)
+    assert len(found) == len(set(codes))
+    for key, details in found.items():
+        assert details.current_price == expected_price(key)[1]
+    # 每个分类翻到最后一页之后的空页为止，首页一次
+    pages_per_category = -(-CATEGORY_SIZE // LISTING_PAGE_SIZE) + 1
+    assert server.snapshot_stats()['requests'] == 1 + len(CATEGORIES) * pages_per_category
+
+
+def test_snapshot_prices_are_recorded_in_calendar(tmp_path):
+    codes = category_products(CATEGORIES[1])[:5]
+    snapshot = CatalogSnapshot()
+    snapshot.put_many(parse_listing_page(render_listing_page(CATEGORIES[1])))
+    calendar = PromoCalendar()
+
+    excel_file = tmp_path / '订单汇总.xlsx'
+    rows = [{'订单号': 'A1', '商品货号': format_product_code(code), '数量': 1, '商品单价': 9999.0}
+            for code in codes]
+    pd.DataFrame(rows, columns=LEDGER_COLUMNS).to_excel(excel_file, index=False)
+
+    def fetch_details(product_number):
+        raise AssertionError(f"快照中已有 {product_number}，不应在线查询")
+
+    assert update_excel_prices(str(excel_file), fetch_details=fetch_details, calendar=calendar, snapshot=snapshot)
+    for code in codes:
+        assert calendar.next_check(code) is not None
+    written = pd.read_excel(excel_file)
+    assert written['现价'].tolist() == [expected_price(code)[1] for code in codes]
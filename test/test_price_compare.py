@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 被测试的模块在上一级目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from models import product_key
+from price_compare import compare_prices, normalize_product_codes
+
+
+def test_numeric_codes_with_blank_cell():
+    # 货号列有空单元格时 pandas 把整列读成 float64
+    df = pd.DataFrame({
+        '订单号': ['A1', 'A1', 'A2'],
+        '商品货号': [70531656, None, 10263524],
+        '数量': [1, 1, 2],
+        '商品单价': [199.0, 10.0, 49.0],
+        '现价': [None, None, None],
+    })
+    assert df['商品货号'].dtype == np.float64
+
+    labels, keys = normalize_product_codes(df['商品货号'])
+    assert sorted(keys.tolist()) == [10263524, 70531656]
+    assert labels[1] == -1
+    assert product_key(70531656.0) == 70531656
+
+    compared = compare_prices(df, {'705.316.56': 149.0, '102.635.24': 49.0})
+    assert compared['新现价'].tolist()[0] == 149.0
+    assert compared['新现价'].tolist()[2] == 49.0
+    assert compared['需要标记'].tolist() == [True, False, False]
+
+
+def test_dotted_codes_keep_trailing_zeros():
+    labels, keys = normalize_product_codes(pd.Series(['705.316.00', '705.316.00', 70531600.0]))
+    assert keys[labels].tolist() == [70531600] * 3
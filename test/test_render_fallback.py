@@ -0,0 +1,61 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# 被测试的模块在上一级目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from mock_ikea import MockIkeaServer, expected_price
+from update_ikea_prices import get_product_details, parse_product_page
+
+# 没有用 playwright install chromium 安装浏览器时，可以用环境变量指定已安装的 Chrome/Chromium
+BROWSER_PATH = os.environ.get('CHROMIUM_PATH')
+PRODUCT_NUMBER = '70531656'
+
+
+@pytest.fixture
+def server():
+    server = MockIkeaServer(page_size=20000, script=True)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def renderer():
+    pytest.importorskip('playwright')
+    import render_fallback
+
+    try:
+        pool = render_fallback.configure_renderer(size=1, timeout=10, executable_path=BROWSER_PATH)
+    except Exception as e:
+        pytest.skip(f"无法启动 Chromium: {e}")
+    yield pool
+    pool.close()
+    render_fallback._default_renderer = None
+
+
+def test_script_price_needs_rendering(server):
+    # 价格区块由脚本插入，直接解析HTML找不到价格
+    market = server.market()
+    details = get_product_details(PRODUCT_NUMBER, market=market)
+    assert details.current_price is None
+
+
+def test_render_pool_renders_script_price(server, renderer):
+    market = server.market()
+    url = market.product_url(PRODUCT_NUMBER)
+    html_text = renderer.render(url)
+    assert html_text is not None
+
+    original, current, on_sale = expected_price(PRODUCT_NUMBER)
+    details = parse_product_page(html_text, PRODUCT_NUMBER, url, market)
+    assert details.current_price == current
+    assert details.is_on_sale == on_sale
+    assert renderer.stats['rendered'] == 1
+
+
+def test_get_product_details_falls_back_to_rendering(server, renderer):
+    details = get_product_details(PRODUCT_NUMBER, market=server.market())
+    assert details.current_price == expected_price(PRODUCT_NUMBER)[1]
@@ -1,10 +1,13 @@
-import requests
 from bs4 import BeautifulSoup
 import re
 import random
 import logging
 import time
 
+from fetch_client import default_client
+from markets import get_market
+from page_archive import configure_archive, default_archive
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -18,26 +21,27 @@ USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0'
 ]
 
-def get_product_details(product_number):
-    """获取商品详细信息，包括原价和促销价"""
+def get_product_details(product_number, market=None):
+    """获取商品详细信息，包括原价和促销价；market 为站点代码，默认中国站"""
+    market = get_market(market)
     try:
         # 尝试直接访问商品详情页面
         urls = [
-            f"https://www.ikea.cn/cn/zh/p/akern-a-ke-nei-li-jia-dian-tao-lan-se-xiu-hua-{product_number}/",
-            f"https://www.ikea.cn/cn/zh/search/products/?q={product_number}&qtype=search_keywords"
+            f"{market.base_url}p/akern-a-ke-nei-li-jia-dian-tao-lan-se-xiu-hua-{product_number}/",
+            market.search_url(product_number)
         ]
         
         headers = {
             'User-Agent': random.choice(USER_AGENTS),
             'Accept': 'text/html,application/xhtml+xml,application/xml',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+            'Accept-Language': market.accept_language
         }
         
         response = None
         for url in urls:
             try:
                 logging.info(f"尝试URL: {url}")
-                response = requests.get(url, headers=headers, timeout=10)
+                response = default_client().get(url, headers=headers, timeout=10, key=product_number)
                 if response.status_code == 200:
                     logging.info(f"成功获取页面: {url}")
                     break
@@ -53,10 +57,10 @@ def get_product_details(product_number):
                 "is_on_sale": False
             }
         
-        # 保存HTML内容用于调试
-        with open(f"ikea_{product_number}.html", "w", encoding="utf-8") as f:
-            f.write(response.text)
-        logging.info(f"已保存HTML内容到 ikea_{product_number}.html")
+        # 保存HTML内容用于调试（由后台线程压缩写入页面存档，不阻塞查询）
+        archive = default_archive()
+        if archive is not None:
+            archive.put(product_number, url, response.text, response.status_code)
         
         soup = BeautifulSoup(response.text, 'html.parser')
         
@@ -77,27 +81,27 @@ def get_product_details(product_number):
         # 优先查找特定模式
         if "会员价" in html_text or "非会员价" in html_text:
             # ÅKERNEJLIKA 阿克奈利加模式：非会员价¥129.00¥69.00
-            match = re.search(r'非会员价\s*¥\s*(\d+(?:\.\d{2})?)\s*¥\s*(\d+(?:\.\d{2})?)', html_text)
+            match = re.search(r'非会员价\s*' + market.price_pattern + r'\s*' + market.price_pattern, html_text)
             if match:
-                original_price = float(match.group(1))
-                current_price = float(match.group(2))
+                original_price = market.parse_number(match.group(1))
+                current_price = market.parse_number(match.group(2))
                 logging.info(f"从会员价模式找到 - 原价: {original_price}, 现价: {current_price}")
         
         # 如果上面的模式没有匹配，尝试BRUNKRISSLA布朗瑞拉模式
         if not original_price or not current_price:
             # 查找模式：¥199.00¥149.00
-            match = re.search(r'¥\s*(\d+(?:\.\d{2})?)\s*¥\s*(\d+(?:\.\d{2})?)', html_text)
+            match = re.search(market.price_pattern + r'\s*' + market.price_pattern, html_text)
             if match:
                 # 第一个价格是原价，第二个是现价
-                original_price = float(match.group(1))
-                current_price = float(match.group(2))
+                original_price = market.parse_number(match.group(1))
+                current_price = market.parse_number(match.group(2))
                 logging.info(f"从价格对模式找到 - 原价: {original_price}, 现价: {current_price}")
         
         # 如果仍然没有找到，尝试从页面中提取所有价格
         if not original_price or not current_price:
-            all_prices = re.findall(r'¥\s*(\d+(?:\.\d{2})?)', html_text)
+            all_prices = re.findall(market.price_pattern, html_text)
             if all_prices:
-                prices = [float(p) for p in all_prices]
+                prices = [market.parse_number(p) for p in all_prices]
                 unique_prices = sorted(set(prices))
                 logging.info(f"页面中找到的所有价格: {unique_prices}")
                 
@@ -118,11 +122,7 @@ def get_product_details(product_number):
             is_on_sale = True
         
         # 从页面标签判断是否促销
-        sale_indicators = [
-            "优惠有效期", "更低价格", "会员价", "限时", "促销", "特价"
-        ]
-        
-        for indicator in sale_indicators:
+        for indicator in market.sale_indicators:
             if indicator in html_text:
                 logging.info(f"找到促销指标: {indicator}")
                 if original_price and current_price and original_price > current_price:
@@ -152,6 +152,9 @@ if __name__ == "__main__":
         "90554802"   # BRUNKRISSLA 布朗瑞拉
     ]
     
+    # 抓取的页面保存到 page_archive 目录，用 ikea_prices.py archive <货号> 查看
+    configure_archive("page_archive")
+    
     print("\n=== 开始测试商品价格获取 ===\n")
     
     results = []
@@ -1,14 +1,20 @@
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 import time
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
 import random
+import dataclasses
+import itertools
 import logging
 import re
+import hashlib
 from pathlib import Path
 
+from markets import get_market
+from models import ProductPrice, product_code_text, product_key
+from page_archive import default_archive
+from structured_log import counters
+
+# pandas/openpyxl/requests 等较重的依赖在用到的函数里再导入，
+# 这样只查询单个商品时不必加载表格相关的库，启动更快
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -27,8 +33,8 @@ def clean_product_number(product_number):
     if not product_number:
         return None
     
-    # 转换为字符串
-    product_number = str(product_number)
+    # 转换为字符串（整数值的浮点数按整数处理）
+    product_number = product_code_text(product_number)
     
     # 移除空格
     product_number = product_number.strip()
@@ -36,11 +42,21 @@ def clean_product_number(product_number):
     # 获取纯数字版本（移除小数点等）
     clean_number = ''.join(filter(str.isdigit, product_number))
     
-    logging.info(f"清理货号: 原始值 -> {product_number}, 纯数字 -> {clean_number}")
+    # 每个货号都会经过这里，只计数，需要时用 DEBUG 级别查看
+    counters.count("清理货号")
+    logging.debug("清理货号: 原始值 -> %s, 纯数字 -> %s", product_number, clean_number)
     return clean_number
 
-def get_product_details(product_number):
-    """获取商品详细信息，包括原价和促销价"""
+def get_product_details(product_number, client=None, market=None):
+    """获取商品详细信息，包括原价和促销价
+    
+    client 为 fetch_client.FetchClient，不传时使用进程内共用的连接池客户端。
+    客户端配置了 validators（ValidatorStore）时会发送条件请求，页面未修改(304)
+    或价格区块没有变化时直接返回上次的结果（货号为这次查询传入的货号），不再重新解析；
+    返回304但没有上次的结果时，不带条件请求头重新请求完整页面。
+    market 为站点代码或 markets.Market，默认中国站。
+    """
+    market = get_market(market)
     try:
         # 保存原始货号格式用于搜索
         original_format = str(product_number).strip()
@@ -48,160 +64,306 @@ def get_product_details(product_number):
         # 获取清理后的纯数字货号
         clean_number = clean_product_number(product_number)
         if not clean_number:
-            logging.error(f"无效的货号: {product_number}")
-            return {
-                "product_number": product_number,
-                "original_price": None,
-                "current_price": None,
-                "is_on_sale": False
-            }
-        
-        # 尝试多种可能的URL
-        urls = [
-            f"https://www.ikea.cn/cn/zh/search/products/?q={original_format}&qtype=search_keywords",  # 使用原始格式(带点)
-            f"https://www.ikea.cn/cn/zh/search/products/?q={clean_number}&qtype=search_keywords",   # 使用纯数字格式
-            f"https://www.ikea.cn/cn/zh/p/-{clean_number}/"  # 通用URL模式
-        ]
+            logging.error("无效的货号: %s", product_number)
+            return ProductPrice(product_number, market=market.code)
+        
+        # 尝试多种可能的URL：原始格式(带点)搜索、纯数字搜索、通用商品页
+        urls = market.product_urls(original_format, clean_number)
         
         headers = {
             'User-Agent': random.choice(USER_AGENTS),
             'Accept': 'text/html,application/xhtml+xml,application/xml',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+            'Accept-Language': market.accept_language
         }
         
+        from fetch_client import default_client
+        
+        client = client or default_client()
+        validators = client.validators
         response = None
         successful_url = None
         
         for url in urls:
             try:
-                logging.info(f"尝试URL: {url}")
-                response = requests.get(url, headers=headers, timeout=10)
+                counters.count("请求页面")
+                logging.debug("尝试URL: %s", url)
+                response = client.get(url, headers=headers, timeout=10, key=clean_number)
+                if response.status_code == 304:
+                    # 页面自上次查询后没有变化，直接使用上次的结果
+                    cached = validators.cached_result(url) if validators else None
+                    if cached is not None:
+                        counters.count("页面未修改")
+                        logging.debug("页面未修改(304): %s", url)
+                        return dataclasses.replace(cached, product_number=product_number)
+                    # 上次的结果已不在（例如被别的进程清掉），不带条件请求头重新取完整页面
+                    logging.debug("页面未修改(304)但没有上次的结果，重新请求: %s", url)
+                    response = client.get(url, headers=headers, timeout=10, key=clean_number, conditional=False)
                 if response.status_code == 200:
                     successful_url = url
-                    logging.info(f"成功获取页面: {url}")
+                    logging.debug("成功获取页面: %s", url)
                     break
             except Exception as e:
-                logging.warning(f"URL {url} 访问失败: {str(e)}")
+                counters.count("页面访问失败")
+                logging.warning("URL %s 访问失败: %s", url, e, extra={'product': product_number})
         
         if not response or response.status_code != 200:
-            logging.error(f"无法获取商品 {product_number} 页面")
-            return {
-                "product_number": product_number,
-                "original_price": None,
-                "current_price": None,
-                "is_on_sale": False
-            }
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
+            counters.count("无法获取页面")
+            logging.error("无法获取商品 %s 页面", product_number, extra={'product': product_number})
+            return ProductPrice(product_number, market=market.code)
+        
         html_text = response.text
         
-        # 修改价格提取逻辑 - 使用更精确的正则表达式
-        # 查找形如 ¥1499.00 或 ¥1,499.00 的价格
-        price_pattern = r'¥\s*([\d,]+(?:\.\d{2})?)'
-        matches = re.findall(price_pattern, html_text)
-        
-        if matches:
-            # 移除逗号并转换为浮点数
-            prices = []
-            for match in matches:
-                try:
-                    # 移除逗号
-                    clean_price = match.replace(',', '')
-                    prices.append(float(clean_price))
-                except ValueError:
-                    continue
-            
-            # 过滤有效价格并排序
-            valid_prices = [p for p in prices if p > 0]
-            unique_prices = sorted(set(valid_prices))
-            
-            logging.info(f"页面中找到的所有价格: {unique_prices}")
+        # 配置了页面存档时交给后台线程保存，便于以后调试和重新解析
+        archive = default_archive()
+        if archive is not None:
+            archive.put(product_number, successful_url, html_text, response.status_code)
+        
+        # 价格区块没有变化时直接使用上次的解析结果
+        block_hash = price_block_hash(html_text)
+        if validators and block_hash:
+            cached = validators.unchanged_result(successful_url, block_hash)
+            if cached is not None:
+                counters.count("价格区块未变化")
+                logging.debug("商品 %s 价格区块未变化，使用上次的结果", product_number)
+                return dataclasses.replace(cached, product_number=product_number)
+        
+        details = parse_product_page(html_text, product_number, successful_url, market)
+        if details.current_price is None:
+            details = render_and_parse(successful_url, product_number, market) or details
+        if validators:
+            validators.save_result(successful_url, block_hash, details, response)
+        return details
             
-            # 初始化价格变量
-            original_price = None
-            current_price = None
+    except Exception as e:
+        logging.error("获取商品 %s 详细信息时出错: %s", product_number, e, exc_info=True,
+                      extra={'product': product_number})
+        return ProductPrice(product_number, market=market.code)
+
+def render_and_parse(url, product_number, market=None):
+    """价格区块由 JavaScript 渲染、直接解析找不到价格时，用无头浏览器渲染后再解析
+
+    只在配置了渲染池（render_fallback.configure_renderer）时使用，否则返回 None
+    """
+    from render_fallback import default_renderer
+    
+    renderer = default_renderer()
+    if renderer is None:
+        return None
+    counters.count("浏览器渲染")
+    logging.info("页面中没有找到价格，使用无头浏览器渲染: %s", url)
+    html_text = renderer.render(url)
+    if not html_text:
+        return None
+    archive = default_archive()
+    if archive is not None:
+        archive.put(product_number, url, html_text)
+    return parse_product_page(html_text, product_number, url, market)
+
+def parse_product_page(html_text, product_number, url=None, market=None):
+    """从商品页面HTML中提取原价、现价和是否促销；价格格式和促销标签按站点（market）区分"""
+    market = get_market(market)
+    
+    # 修改价格提取逻辑 - 使用更精确的正则表达式
+    # 查找形如 ¥1499.00 或 ¥1,499.00（德国站 1.499,00 €）的价格
+    matches = re.findall(market.price_pattern, html_text)
+    
+    if matches:
+        # 去掉千位分隔符并转换为浮点数
+        prices = []
+        for match in matches:
+            try:
+                prices.append(market.parse_number(match))
+            except ValueError:
+                continue
+        
+        # 过滤有效价格并排序
+        valid_prices = [p for p in prices if p > 0]
+        unique_prices = sorted(set(valid_prices))
+        
+        logging.debug("页面中找到的所有价格: %s", unique_prices)
+        
+        # 初始化价格变量
+        original_price = None
+        current_price = None
+        
+        # 如果有多个价格，尝试识别原价和现价
+        if len(unique_prices) >= 2:
+            # 检查是否有一个价格是下面情况之一：
+            # 1. 非常低（如1元、2元），这可能是错误
+            # 2. 与其他价格差异非常大
             
-            # 如果有多个价格，尝试识别原价和现价
-            if len(unique_prices) >= 2:
-                # 检查是否有一个价格是下面情况之一：
-                # 1. 非常低（如1元、2元），这可能是错误
-                # 2. 与其他价格差异非常大
-                
-                # 如果最低价格小于10元且与第二低价格差异很大，可能是错误
-                if unique_prices[0] < 10 and unique_prices[1] / unique_prices[0] > 10:
-                    logging.warning(f"检测到异常低价: {unique_prices[0]}，忽略此价格")
-                    # 使用第二低和最高价格
-                    current_price = unique_prices[1]
-                    original_price = unique_prices[-1]
-                else:
-                    # 正常情况：最低价是现价，最高价是原价
-                    current_price = unique_prices[0]
-                    original_price = unique_prices[-1]
-                
-                logging.info(f"选择 - 原价: {original_price}, 现价: {current_price}")
-            elif len(unique_prices) == 1:
-                # 只有一个价格时，原价和现价相同
-                original_price = unique_prices[0]
+            # 如果最低价格小于10元且与第二低价格差异很大，可能是错误
+            if unique_prices[0] < 10 and unique_prices[1] / unique_prices[0] > 10:
+                logging.warning("检测到异常低价: %s，忽略此价格", unique_prices[0], extra={'product': product_number})
+                # 使用第二低和最高价格
+                current_price = unique_prices[1]
+                original_price = unique_prices[-1]
+            else:
+                # 正常情况：最低价是现价，最高价是原价
                 current_price = unique_prices[0]
-                logging.info(f"只找到一个价格: {current_price}")
+                original_price = unique_prices[-1]
+            
+            logging.debug("选择 - 原价: %s, 现价: %s", original_price, current_price)
+        elif len(unique_prices) == 1:
+            # 只有一个价格时，原价和现价相同
+            original_price = unique_prices[0]
+            current_price = unique_prices[0]
+            logging.debug("只找到一个价格: %s", current_price)
+    else:
+        counters.count("页面没有价格")
+        logging.warning("商品 %s 的页面中没有找到任何价格信息", product_number, extra={'product': product_number, 'url': url})
+        return ProductPrice(product_number, market=market.code)
+    
+    # 判断是否促销
+    is_on_sale = False
+    if original_price and current_price and original_price > current_price:
+        # 不要标记差异太大的价格为促销（可能是数据错误）
+        if current_price < 10 and original_price / current_price > 100:
+            logging.warning("价格差异过大，可能是错误数据: 原价 %s, 现价 %s", original_price, current_price)
+            is_on_sale = False
+            # 将现价设置为与原价相同，避免错误数据
+            current_price = original_price
         else:
-            logging.warning(f"没有找到任何价格信息")
-            return {
-                "product_number": product_number,
-                "original_price": None,
-                "current_price": None,
-                "is_on_sale": False
-            }
-        
-        # 判断是否促销
-        is_on_sale = False
-        if original_price and current_price and original_price > current_price:
-            # 不要标记差异太大的价格为促销（可能是数据错误）
-            if current_price < 10 and original_price / current_price > 100:
-                logging.warning(f"价格差异过大，可能是错误数据: 原价 {original_price}, 现价 {current_price}")
-                is_on_sale = False
-                # 将现价设置为与原价相同，避免错误数据
-                current_price = original_price
-            else:
-                is_on_sale = True
-        
-        # 从页面标签确认是否促销
-        sale_indicators = ["优惠有效期", "更低价格", "会员价", "限时", "促销", "特价"]
-        for indicator in sale_indicators:
-            if indicator in html_text:
-                logging.info(f"找到促销指标: {indicator}")
-                if original_price and current_price and original_price > current_price:
-                    # 再次检查价格差异是否合理
-                    if current_price < 10 and original_price / current_price > 100:
-                        logging.warning(f"尽管有促销指标，但价格差异过大: 原价 {original_price}, 现价 {current_price}")
-                        is_on_sale = False
-                        current_price = original_price
-                    else:
-                        is_on_sale = True
-                    break
+            is_on_sale = True
+    
+    # 从页面标签确认是否促销
+    for indicator in market.sale_indicators:
+        if indicator in html_text:
+            logging.debug("找到促销指标: %s", indicator)
+            if original_price and current_price and original_price > current_price:
+                # 再次检查价格差异是否合理
+                if current_price < 10 and original_price / current_price > 100:
+                    logging.warning("尽管有促销指标，但价格差异过大: 原价 %s, 现价 %s", original_price, current_price)
+                    is_on_sale = False
+                    current_price = original_price
+                else:
+                    is_on_sale = True
+                break
+    
+    # 优惠有效期，用于安排促销结束后的复查（见 promo_calendar）
+    promo_start, promo_end = market.parse_promo_window(html_text)
+    if promo_end:
+        logging.debug("优惠有效期: %s 至 %s", promo_start, promo_end)
+    
+    return ProductPrice(
+        product_number=product_number,
+        original_price=original_price,
+        current_price=current_price,
+        is_on_sale=is_on_sale,
+        url=url,
+        market=market.code,
+        promo_start=promo_start,
+        promo_end=promo_end
+    )
+
+def price_block_hash(html_text):
+    """计算商品页面价格区块的指纹，页面其他部分（推荐商品、脚本等）的变化不影响结果
+    
+    找不到价格区块（例如搜索结果页）时返回 None
+    """
+    start = html_text.find('class="price"')
+    if start == -1:
+        return None
+    end = html_text.find('i-modal-wrapper', start, start + 5000)
+    if end == -1:
+        end = start + 5000
+    return hashlib.sha1(html_text[start:end].encode('utf-8')).hexdigest()
+
+def collect_product_codes(excel_file):
+    """从Excel读取需要查询的商品货号（去重，保持首次出现的顺序）"""
+    from openpyxl import load_workbook
+    from ledger_delta import pending_changes
+    
+    wb = load_workbook(excel_file, read_only=True)
+    ws = wb.active
+    
+    product_code_col = None
+    for col, cell_value in enumerate(next(ws.iter_rows(min_row=1, max_row=1, values_only=True)), start=1):
+        if cell_value == '商品货号':
+            product_code_col = col
+            break
+    
+    if not product_code_col:
+        wb.close()
+        logging.error(f"无法找到'商品货号'列")
+        return []
+    
+    # 以增量方式追加、尚未合并进表格的行也要查询
+    cells, _ = pending_changes(excel_file)
+    pending_codes = [(value,) for (row, column), value in sorted(cells.items()) if column == '商品货号']
+    
+    codes = []
+    seen = set()
+    rows = ws.iter_rows(min_row=2, min_col=product_code_col, max_col=product_code_col, values_only=True)
+    for row in itertools.chain(rows, pending_codes):
+        product_code = row[0]
         
-        return {
-            "product_number": product_number,
-            "original_price": original_price,
-            "current_price": current_price,
-            "is_on_sale": is_on_sale,
-            "url": successful_url
-        }
-            
-    except Exception as e:
-        logging.error(f"获取商品 {product_number} 详细信息时出错: {str(e)}")
-        return {
-            "product_number": product_number,
-            "original_price": None,
-            "current_price": None,
-            "is_on_sale": False
-        }
+        # 跳过空行和自提/物流货号
+        if not product_code or str(product_code).startswith('500.'):
+            continue
+        
+        product_code = str(product_code).strip()
+        key = clean_product_number(product_code)
+        if key and key not in seen:
+            seen.add(key)
+            codes.append(product_code)
+    
+    wb.close()
+    return codes
+
+def read_ledger_frame(ws):
+    """把工作表读成DataFrame，索引为Excel中的行号（表头为第1行）"""
+    import pandas as pd
+    
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if not header:
+        return pd.DataFrame()
+    data = list(rows)
+    return pd.DataFrame(data, columns=list(header), index=range(2, len(data) + 2))
 
-def update_excel_prices(excel_file):
-    """从Excel读取商品货号，获取当前价格并填入到现价列"""
+def read_ledger_rows(ws, index, rows):
+    """只读取索引中指定的行，得到与 read_ledger_frame 相同结构的DataFrame"""
+    import pandas as pd
+    
+    columns = list(index.columns)
+    data = [[ws.cell(row=row, column=index.columns[name]).value for name in columns] for row in rows]
+    return pd.DataFrame(data, columns=columns, index=list(rows))
+
+def apply_product_details(excel_file, details_by_code, index=None, delta=False):
+    """将已获取的商品价格写回Excel，并标记价格变化/降价的行
+    
+    details_by_code 以整数货号（models.product_key）为键，值为 get_product_details 返回的 ProductPrice。
+    比对在整张表上一次完成（见 price_compare），只对需要标记的行设置填充色。
+    传入 index（ledger_index.LedgerIndex）时只读取和比对这些货号所在的行。
+    delta=True 时不改写Excel，只把改动追加到增量文件（见 ledger_delta），之后用 compact 合并；
+    此时如果同时传入 index，只读取这些行（见 LedgerIndex.read_rows），耗时与表格大小基本无关。
+    """
+    from openpyxl import load_workbook
+    from ledger_delta import load_ledger_workbook, mark_row, overlay_frame, record_changes, save_ledger_workbook
+    from ledger_index import LedgerIndex, index_path
+    from price_compare import PriceTable, compare_prices, summarize_price_drops
+    
     try:
-        # 加载Excel文件
-        df = pd.read_excel(excel_file)
+        if delta and index is not None:
+            # 只读取这些货号所在的行，并叠加之前尚未合并的改动
+            df = index.read_rows(row for key in details_by_code for row in index.rows.get(key, []))
+        elif delta:
+            # 只读方式流式读取，并叠加之前尚未合并的改动
+            wb = load_workbook(excel_file, read_only=True)
+            try:
+                df = overlay_frame(read_ledger_frame(wb.active), excel_file)
+            finally:
+                wb.close()
+        else:
+            # 创建工作簿对象（已包含增量文件中的改动）
+            wb = load_ledger_workbook(excel_file)
+            ws = wb.active
+            if index is not None:
+                rows = sorted(row for key in details_by_code for row in index.rows.get(key, []))
+                df = read_ledger_rows(ws, index, rows)
+            else:
+                df = read_ledger_frame(ws)
         
         # 确保必要的列存在
         required_columns = ['订单号', '商品货号', '数量', '商品单价', '现价']
@@ -210,115 +372,186 @@ def update_excel_prices(excel_file):
                 logging.error(f"Excel表格中缺少必要的列: {col}")
                 return False
         
-        # 创建工作簿对象
-        wb = load_workbook(excel_file)
-        ws = wb.active
-        
-        # 查找列的索引
-        header_row = 1  # 表头行号
-        product_code_col = None
-        current_price_col = None
-        unit_price_col = None
-        
-        for col in range(1, ws.max_column + 1):
-            cell_value = ws.cell(row=header_row, column=col).value
-            if cell_value == '商品货号':
-                product_code_col = col
-            elif cell_value == '现价':
-                current_price_col = col
-            elif cell_value == '商品单价':
-                unit_price_col = col
-        
-        if not product_code_col or not current_price_col or not unit_price_col:
-            logging.error(f"无法找到'商品货号'、'现价'或'商品单价'列")
-            return False
-            
-        logging.info(f"列索引: 商品货号={product_code_col}, 现价={current_price_col}, 商品单价={unit_price_col}")
+        new_prices = PriceTable.from_details(details_by_code.values())
+        compared = compare_prices(df, new_prices)
+        updated = compared[compared['新现价'].notna()]
+        flagged = compared[compared['需要标记']]
         
-        # 黄色填充样式（用于标记价格变化）
-        yellow_fill = PatternFill(start_color='FFFF00',
-                                 end_color='FFFF00',
-                                 fill_type='solid')
+        missing = [details.product_number for details in details_by_code.values() if not details.current_price]
+        if missing:
+            logging.warning(f"无法获取 {len(missing)} 个商品的价格: {missing}")
         
-        # 处理每个商品
-        updated_count = 0
-        price_change_count = 0
+        summary = summarize_price_drops(compared)
+        if not summary.empty:
+            logging.info(f"降价商品汇总:\n{summary.to_string(index=False)}")
         
-        # 从第2行开始（跳过表头）
-        for row in range(2, ws.max_row + 1):
-            product_code = ws.cell(row=row, column=product_code_col).value
+        if delta:
+            # 索引记录了增量文件的大小，追加改动后一并更新，避免下次重新扫描
+            if index is None and index_path(excel_file).exists():
+                index = LedgerIndex.load(excel_file)
+            changes = [(row, '现价', float(current_price)) for row, current_price in updated['新现价'].items()]
+            count = record_changes(excel_file, changes, flagged.index)
+            if index is not None:
+                index.save(refresh_signature=True)
+            logging.info(f"已把 {count} 条改动写入增量文件")
+        else:
+            # 查找列的索引
+            current_price_col = index.columns['现价'] if index is not None else list(df.columns).index('现价') + 1
             
-            # 跳过空行和自提/物流货号
-            if not product_code or str(product_code).startswith('500.'):
-                continue
-                
-            product_code = str(product_code).strip()
-            logging.info(f"处理第 {row} 行，商品货号: {product_code}")
+            # 写入现价
+            for row, current_price in updated['新现价'].items():
+                ws.cell(row=row, column=current_price_col).value = float(current_price)
             
-            # 获取商品当前价格
-            details = get_product_details(product_code)
-            current_price = details.get('current_price')
+            # 标记价格变化或现价低于商品单价的行
+            for row in flagged.index:
+                mark_row(ws, row)
             
-            # 如果成功获取价格，更新Excel
-            if current_price:
-                # 获取现有价格（如果有）
-                existing_price_cell = ws.cell(row=row, column=current_price_col)
-                existing_price = existing_price_cell.value
-                
-                # 获取商品单价
-                unit_price_cell = ws.cell(row=row, column=unit_price_col)
-                unit_price = unit_price_cell.value
-                
-                # 更新价格
-                existing_price_cell.value = current_price
-                updated_count += 1
-                
-                # 检查价格是否变化
-                if existing_price and existing_price != current_price:
-                    logging.info(f"价格变化: {product_code} - 原来: {existing_price}, 现在: {current_price}")
-                    for col in range(1, ws.max_column + 1):
-                        ws.cell(row=row, column=col).fill = yellow_fill
-                    price_change_count += 1
-                
-                # 【新功能】检查现价是否低于商品单价，如果是则标记为黄色
-                if unit_price and current_price < unit_price:
-                    logging.info(f"现价低于商品单价: {product_code} - 单价: {unit_price}, 现价: {current_price}")
-                    for col in range(1, ws.max_column + 1):
-                        ws.cell(row=row, column=col).fill = yellow_fill
-                    
-                logging.info(f"更新商品 {product_code} 的现价为 {current_price}")
-            else:
-                logging.warning(f"无法获取商品 {product_code} 的价格")
-                
-            # 随机延迟，避免被网站封锁
-            time.sleep(random.uniform(1, 3))
+            # 保存更新后的Excel文件，并让索引记录保存后的文件状态（行的位置没有变化）
+            if index is None:
+                index = LedgerIndex.from_frame(df.reset_index(drop=True), excel_file)
+            save_ledger_workbook(wb, excel_file, index)
         
-        # 保存更新后的Excel文件
-        wb.save(excel_file)
-        logging.info(f"Excel更新完成。共更新 {updated_count} 个价格，{price_change_count} 个价格有变化。")
+        logging.info(f"Excel更新完成。共更新 {len(updated)} 个价格，"
+                     f"{int(compared['价格变化'].sum())} 个价格有变化，"
+                     f"{int(compared['低于单价'].sum())} 个现价低于商品单价，"
+                     f"可退差额合计 {compared['可退差额'].sum():.2f}。")
         
         return True
+    except Exception as e:
+        logging.error(f"写回Excel时出错: {str(e)}")
+        return False
+
+def update_products(excel_file, product_codes, fetch_details=None, delta=True):
+    """只查询并更新指定的几个商品货号
+    
+    通过订单汇总表的货号索引（ledger_index）直接定位这些货号所在的行，
+    不扫描表头和其他行；表中没有的货号会被忽略。
+    默认只把改动追加到增量文件（delta 同 apply_product_details），读写都只涉及这些行；
+    delta=False 时打开并完整保存整个Excel，耗时与表格大小成正比。
+    """
+    from ledger_index import LedgerIndex
+    
+    try:
+        index = LedgerIndex.load(excel_file)
+        fetch_details = fetch_details or get_product_details
+        
+        details_by_code = {}
+        for product_code in product_codes:
+            key = product_key(product_code)
+            if key in details_by_code:
+                continue
+            if not index.rows_for(product_code):
+                logging.warning("订单汇总表中没有商品货号: %s", product_code)
+                continue
+            details_by_code[key] = fetch_details(product_code)
+        
+        if not details_by_code:
+            return False
+        return apply_product_details(excel_file, details_by_code, index, delta)
+    except Exception as e:
+        logging.error(f"更新指定商品时出错: {str(e)}")
+        return False
+    finally:
+        counters.log_summary()
+
+def update_excel_prices(excel_file, fetch_details=None, delta=False, calendar=None, snapshot=None,
+                        concurrency=None):
+    """从Excel读取商品货号，获取当前价格并填入到现价列
+    
+    fetch_details 为自定义的查询函数（货号 -> ProductPrice），由它自己负责限速；
+    不传时直接调用 get_product_details，并在每次查询之间随机等待；
+    默认客户端配置了代理池时不等待，由每个代理自己限速。
+    concurrency 为同时查询的商品数；不传时默认客户端配置了代理池则按代理数并发（最多32个），否则逐个查询。
+    delta=True 时只把改动写入增量文件，不改写整个Excel（见 apply_product_details）。
+    calendar 为 promo_calendar.PromoCalendar 时跳过价格锁定在优惠期内或刚查过的商品，这些行保持不变。
+    snapshot 为 catalog_snapshot.CatalogSnapshot 时先从目录快照读取价格，只有快照中没有的商品才在线查询
+    """
+    import pandas as pd
+    from fetch_client import default_client
+    
+    try:
+        # 先检查表头，避免查询完所有价格后才发现缺列
+        columns = pd.read_excel(excel_file, nrows=0).columns
+        for col in ['订单号', '商品货号', '数量', '商品单价', '现价']:
+            if col not in columns:
+                logging.error(f"Excel表格中缺少必要的列: {col}")
+                return False
+        
+        product_codes = collect_product_codes(excel_file)
+        if calendar is not None:
+            product_codes, skipped = calendar.plan(product_codes)
+            for product_code, next_check in skipped:
+                logging.debug("跳过商品货号 %s，下次查询时间 %s", product_code, next_check)
+            logging.info(f"按促销日历跳过 {len(skipped)} 个商品")
+        logging.info(f"共 {len(product_codes)} 个不同的商品货号需要查询")
+        
+        # 同一货号只查询一次，结果写回所有对应的行
+        details_by_code = {}
+        if snapshot is not None:
+            details_by_code = snapshot.get_many(product_codes)
+            product_codes = [code for code in product_codes if product_key(code) not in details_by_code]
+            if calendar is not None:
+                # 与在线查询的结果一样记入促销日历，下次按优惠有效期安排复查
+                for details in details_by_code.values():
+                    calendar.record(details)
+            logging.info(f"目录快照中找到 {len(details_by_code)} 个商品，{len(product_codes)} 个需要在线查询")
+        proxy_pool = default_client().proxy_pool
+        if concurrency is None:
+            concurrency = min(32, len(proxy_pool.proxies)) if proxy_pool else 1
+        
+        def fetch(indexed):
+            i, product_code = indexed
+            logging.debug("查询商品货号: %s", product_code)
+            if counters.sample("查询商品", 50):
+                logging.info("正在查询第 %d/%d 个商品: %s", i, len(product_codes), product_code)
+            if fetch_details:
+                return fetch_details(product_code)
+            details = get_product_details(product_code)
+            
+            # 随机延迟，避免被网站封锁（使用代理池时由每个代理自己的限速控制）
+            if not proxy_pool and concurrency == 1:
+                time.sleep(random.uniform(1, 3))
+            return details
+        
+        if concurrency > 1:
+            # 使用代理池时每个代理单独限速，并发查询使吞吐量随代理数增加
+            from concurrent.futures import ThreadPoolExecutor
+            
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(fetch, enumerate(product_codes, 1)))
+        else:
+            results = map(fetch, enumerate(product_codes, 1))
+        for product_code, details in zip(product_codes, results):
+            details_by_code[product_key(product_code)] = details
+            if calendar is not None:
+                calendar.record(details)
+        
+        return apply_product_details(excel_file, details_by_code, delta=delta)
     except Exception as e:
         logging.error(f"更新Excel时出错: {str(e)}")
         return False
+    finally:
+        counters.log_summary()
 
 def test_single_product(product_number):
     """测试单个商品的价格获取"""
     print(f"\n正在测试商品 {product_number}...")
     details = get_product_details(product_number)
     print(f"商品: {product_number}")
-    print(f"原价: {details.get('original_price')}")
-    print(f"现价: {details.get('current_price')}")
-    print(f"是否促销: {details.get('is_on_sale')}")
-    if 'url' in details:
-        print(f"成功URL: {details.get('url')}")
+    print(f"原价: {details.original_price}")
+    print(f"现价: {details.current_price}")
+    print(f"是否促销: {details.is_on_sale}")
+    if details.promo_end:
+        print(f"优惠有效期: {details.promo_start} 至 {details.promo_end}")
+    if details.url:
+        print(f"成功URL: {details.url}")
     return details
 
 def test_with_unit_price(product_number, unit_price):
     """测试单个商品的价格获取并与单价比较"""
     print(f"\n正在测试商品 {product_number}，单价 {unit_price}...")
     details = get_product_details(product_number)
-    current_price = details.get('current_price')
+    current_price = details.current_price
     print(f"商品: {product_number}")
     print(f"单价: {unit_price}")
     print(f"现价: {current_price}")
@@ -339,6 +572,11 @@ if __name__ == "__main__":
     # 是否进行测试模式
     TEST_MODE = False
     
+    # 运行方式: "local" 本机直接查询; "coordinator" 协调者，规划货号并合并结果;
+    # "worker" 工作节点，从队列领取货号查询（可在多台机器上同时运行）
+    RUN_MODE = "local"
+    QUEUE_URL = "sqlite:///F:\\宜家自动查询\\price_queue.db"  # 也可以是 redis://host:6379/0
+    
     if TEST_MODE:
         # 测试模式，只检查特定商品
         test_products = [
@@ -360,15 +598,28 @@ if __name__ == "__main__":
         
         print("\n=== 测试结果汇总 ===")
         for result, unit_price in results:
-            current_price = result.get("current_price")
+            current_price = result.current_price
             if current_price:
                 price_lower = "是" if current_price < unit_price else "否"
-                print(f"商品 {result['product_number']}: " 
+                print(f"商品 {result.product_number}: " 
                       f"单价 ¥{unit_price:.2f}, "
                       f"现价 ¥{current_price:.2f}, "
                       f"现价低于单价: {price_lower}")
             else:
-                print(f"商品 {result['product_number']}: 无法获取价格信息")
+                print(f"商品 {result.product_number}: 无法获取价格信息")
+    elif RUN_MODE == "coordinator":
+        from work_queue import open_queue, run_coordinator
+        
+        print(f"协调者模式，开始更新Excel文件: {excel_file}")
+        if run_coordinator(excel_file, open_queue(QUEUE_URL)):
+            print("Excel更新成功！")
+        else:
+            print("Excel更新失败，请检查日志")
+    elif RUN_MODE == "worker":
+        from work_queue import open_queue, run_worker
+        
+        print(f"工作节点模式，队列: {QUEUE_URL}")
+        run_worker(open_queue(QUEUE_URL), exit_when_empty=False)
     else:
         # 正常模式，更新Excel
         print(f"开始更新Excel文件: {excel_file}")
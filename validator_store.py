@@ -0,0 +1,84 @@
+import json
+import sqlite3
+import threading
+import time
+
+from models import ProductPrice
+
+
+class ValidatorStore:
+    """按URL保存页面的缓存校验信息（ETag、Last-Modified、价格区块指纹）和上次的解析结果
+
+    db_path 为 None 时只保存在内存中；指定路径时保存到SQLite，下次运行可以继续使用。
+    """
+
+    def __init__(self, db_path=None):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path or ':memory:', check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                block_hash TEXT,
+                result TEXT,
+                updated_at REAL
+            )
+        ''')
+        self.conn.commit()
+        self.not_modified = 0
+        self.unchanged = 0
+
+    def _row(self, url):
+        return self.conn.execute(
+            'SELECT etag, last_modified, block_hash, result FROM validators WHERE url = ?', (url,)
+        ).fetchone()
+
+    def conditional_headers(self, url):
+        """返回条件请求需要附加的请求头；没有保存过结果时返回空字典"""
+        with self.lock:
+            row = self._row(url)
+        if not row or not row[3]:
+            return {}
+        headers = {}
+        if row[0]:
+            headers['If-None-Match'] = row[0]
+        if row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def cached_result(self, url):
+        """服务器返回304时使用的上次结果"""
+        with self.lock:
+            row = self._row(url)
+            if row and row[3]:
+                self.not_modified += 1
+                return ProductPrice.from_dict(json.loads(row[3]))
+        return None
+
+    def unchanged_result(self, url, block_hash):
+        """价格区块指纹与上次相同时返回上次的结果，否则返回 None"""
+        with self.lock:
+            row = self._row(url)
+            if row and row[3] and row[2] == block_hash:
+                self.unchanged += 1
+                return ProductPrice.from_dict(json.loads(row[3]))
+        return None
+
+    def save_result(self, url, block_hash, details, response=None):
+        """保存一次完整解析的结果；没有查到价格时不保存，下次会重新解析"""
+        if details.current_price is None:
+            return
+        etag = response.headers.get('ETag') if response is not None else None
+        last_modified = response.headers.get('Last-Modified') if response is not None else None
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO validators (url, etag, last_modified, block_hash, result, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (url, etag, last_modified, block_hash,
+                  json.dumps(details.to_dict(), ensure_ascii=False), time.time()))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
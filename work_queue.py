@@ -0,0 +1,283 @@
+import json
+import logging
+import random
+import socket
+import sqlite3
+import time
+import os
+
+from update_ikea_prices import (
+    apply_product_details,
+    clean_product_number,
+    collect_product_codes,
+    get_product_details,
+)
+from models import ProductPrice, product_key
+from structured_log import counters
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# 任务被领取后，超过这个时间没有回传结果就重新放回队列（秒）
+DEFAULT_LEASE_SECONDS = 120
+
+
+class SQLiteWorkQueue:
+    """基于SQLite的任务队列
+
+    适合同一台机器上的多个进程。数据库使用WAL模式，不能放在网络共享盘上，
+    跨多个节点时请使用 RedisWorkQueue。
+    """
+
+    def __init__(self, db_path, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.db_path = str(db_path)
+        self.lease_seconds = lease_seconds
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                product_key TEXT PRIMARY KEY,
+                product_code TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                product_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                worker TEXT,
+                finished_at REAL
+            )
+        ''')
+
+    def push(self, product_codes):
+        """开始新的一轮：清空上一轮的任务和结果，再把商品货号放入队列
+
+        数据库被重复使用时，results() 只会返回这一轮放入的货号的结果。
+        """
+        rows = {}
+        for product_code in product_codes:
+            key = clean_product_number(product_code)
+            if key:
+                rows.setdefault(key, str(product_code).strip())
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute('DELETE FROM tasks')
+            self.conn.execute('DELETE FROM results')
+            self.conn.executemany('INSERT INTO tasks (product_key, product_code) VALUES (?, ?)', rows.items())
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    def claim(self, worker_id):
+        """领取一个待处理的货号，没有任务时返回 None"""
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 超时未完成的任务视为节点掉线，重新放回队列
+            self.conn.execute('''
+                UPDATE tasks SET status = 'pending', worker = NULL, claimed_at = NULL
+                WHERE status = 'claimed' AND claimed_at < ?
+            ''', (now - self.lease_seconds,))
+            row = self.conn.execute('''
+                SELECT product_key, product_code FROM tasks
+                WHERE status = 'pending' ORDER BY attempts, rowid LIMIT 1
+            ''').fetchone()
+            if row:
+                self.conn.execute('''
+                    UPDATE tasks SET status = 'claimed', worker = ?, claimed_at = ?, attempts = attempts + 1
+                    WHERE product_key = ?
+                ''', (worker_id, now, row[0]))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return row[1] if row else None
+
+    def complete(self, product_code, details, worker_id):
+        """回传一个货号的查询结果"""
+        key = clean_product_number(product_code)
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO results (product_key, payload, worker, finished_at)
+                VALUES (?, ?, ?, ?)
+            ''', (key, json.dumps(details.to_dict(), ensure_ascii=False), worker_id, time.time()))
+            self.conn.execute("UPDATE tasks SET status = 'done' WHERE product_key = ?", (key,))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def remaining(self):
+        """还没有完成的任务数量"""
+        return self.conn.execute("SELECT COUNT(*) FROM tasks WHERE status != 'done'").fetchone()[0]
+
+    def results(self):
+        """这一轮已回传的结果，以整数货号为键（上一轮掉线的节点迟到的结果不计入）"""
+        rows = self.conn.execute('''
+            SELECT results.product_key, payload FROM results JOIN tasks USING (product_key)
+        ''').fetchall()
+        return {product_key(key): ProductPrice.from_dict(json.loads(payload)) for key, payload in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+# 领取任务的Lua脚本：在Redis中一次执行，放回超时的任务、取出一个货号并记录租约，
+# 节点在任何时刻掉线都不会让货号同时从待处理列表和已领取集合中消失
+# KEYS: pending, claimed, codes  ARGV: 当前时间, 租约秒数
+CLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], 0, tonumber(ARGV[1]) - tonumber(ARGV[2]))
+for _, key in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], key)
+    redis.call('LPUSH', KEYS[1], key)
+end
+local key = redis.call('RPOP', KEYS[1])
+if not key then
+    return false
+end
+redis.call('ZADD', KEYS[2], ARGV[1], key)
+return redis.call('HGET', KEYS[3], key) or key
+"""
+
+
+class RedisWorkQueue:
+    """基于Redis（或兼容Redis协议的本地服务）的任务队列，适合跨多个节点"""
+
+    def __init__(self, url, prefix='ikea', lease_seconds=DEFAULT_LEASE_SECONDS):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("使用Redis队列需要先安装 redis 包: pip install redis")
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.lease_seconds = lease_seconds
+        self.pending_key = f"{prefix}:pending"
+        self.claimed_key = f"{prefix}:claimed"
+        self.codes_key = f"{prefix}:codes"
+        self.results_key = f"{prefix}:results"
+        self.claim_script = self.client.register_script(CLAIM_SCRIPT)
+
+    def push(self, product_codes):
+        """开始新的一轮：清空上一轮的任务和结果，再把商品货号放入队列
+
+        清空和放入在同一个事务中执行，results() 只会返回这一轮放入的货号的结果。
+        """
+        codes = {}
+        for product_code in product_codes:
+            key = clean_product_number(product_code)
+            if key:
+                codes.setdefault(key, str(product_code).strip())
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self.pending_key, self.claimed_key, self.codes_key, self.results_key)
+        if codes:
+            pipe.hset(self.codes_key, mapping=codes)
+            pipe.lpush(self.pending_key, *codes)
+        pipe.execute()
+        return len(codes)
+
+    def claim(self, worker_id):
+        """领取一个待处理的货号，没有任务时返回 None
+
+        超时未完成的任务视为节点掉线，重新放回队列；放回、取出和记录租约在同一个Lua脚本中原子执行
+        """
+        return self.claim_script(keys=[self.pending_key, self.claimed_key, self.codes_key],
+                                 args=[time.time(), self.lease_seconds])
+
+    def complete(self, product_code, details, worker_id):
+        """回传一个货号的查询结果"""
+        key = clean_product_number(product_code)
+        pipe = self.client.pipeline()
+        pipe.hset(self.results_key, key, json.dumps(details.to_dict(), ensure_ascii=False))
+        pipe.zrem(self.claimed_key, key)
+        pipe.execute()
+
+    def remaining(self):
+        """还没有完成的任务数量"""
+        return self.client.llen(self.pending_key) + self.client.zcard(self.claimed_key)
+
+    def results(self):
+        """这一轮已回传的结果，以整数货号为键（上一轮掉线的节点迟到的结果不计入）"""
+        pushed = set(self.client.hkeys(self.codes_key))
+        return {
+            product_key(key): ProductPrice.from_dict(json.loads(payload))
+            for key, payload in self.client.hgetall(self.results_key).items()
+            if key in pushed
+        }
+
+    def close(self):
+        self.client.close()
+
+
+def open_queue(queue_url):
+    """根据地址打开队列: redis://host:port/0 使用Redis，sqlite:///路径 或普通文件路径使用SQLite"""
+    if queue_url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisWorkQueue(queue_url)
+    if queue_url.startswith('sqlite:///'):
+        queue_url = queue_url[len('sqlite:///'):]
+    return SQLiteWorkQueue(queue_url)
+
+
+def run_coordinator(excel_file, queue, poll_interval=5, timeout=None, delta=False):
+    """协调者：从Excel规划需要查询的货号并放入队列，等待各节点回传结果后写回Excel
+
+    delta 同 update_ikea_prices.apply_product_details
+    """
+    product_codes = collect_product_codes(excel_file)
+    pushed = queue.push(product_codes)
+    logging.info("已将 %d 个商品货号放入队列，等待工作节点处理", pushed)
+
+    started = time.time()
+    while True:
+        remaining = queue.remaining()
+        if remaining == 0:
+            break
+        if timeout is not None and time.time() - started > timeout:
+            logging.warning("等待超时，仍有 %d 个货号未完成，先合并已回传的结果", remaining)
+            break
+        logging.info("剩余 %d 个货号未完成", remaining)
+        time.sleep(poll_interval)
+
+    results = queue.results()
+    logging.info("共收到 %d 个查询结果，开始写回Excel", len(results))
+    return apply_product_details(excel_file, results, delta=delta)
+
+
+def run_worker(queue, worker_id=None, min_delay=1, max_delay=3, exit_when_empty=True, idle_interval=5):
+    """工作节点：不断领取货号、查询价格并回传结果
+
+    每个节点在自己的出口IP上按 min_delay~max_delay 秒的随机间隔访问网站，
+    节点越多，整体吞吐越高。
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    processed = 0
+
+    while True:
+        product_code = queue.claim(worker_id)
+        if product_code is None:
+            if exit_when_empty:
+                break
+            time.sleep(idle_interval)
+            continue
+
+        counters.count("领取货号")
+        logging.debug("[%s] 查询商品货号: %s", worker_id, product_code)
+        details = get_product_details(product_code)
+        queue.complete(product_code, details, worker_id)
+        processed += 1
+
+        # 随机延迟，避免被网站封锁
+        time.sleep(random.uniform(min_delay, max_delay))
+
+    logging.info("[%s] 队列已空，共处理 %d 个货号", worker_id, processed)
+    counters.log_summary()
+    return processed